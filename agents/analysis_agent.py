@@ -1,21 +1,18 @@
 # --- agents/analysis_agent.py ---
 # Agent responsible for generating a detailed natural language summary from structured SOW data.
 
-import json
-from agents.llm_connector import _call_llm # Import the shared LLM caller
+import string
 
-def analysis_agent_run(sow_structured_data: dict, llm_choice: str = "openai") -> str:
-    """
-    Agent responsible for generating a detailed natural language summary from structured SOW data.
-    This acts as the primary "analysis" output for the MVP.
-    """
-    if not sow_structured_data or sow_structured_data.get("error"):
-        return "Cannot summarize: Invalid or missing SOW structured data."
+from agents import json_utils
+from agents.llm_connector import run_prompt, run_prompt_async, run_prompt_stream # Import the shared prompt runners
 
-    sow_json_str = json.dumps(sow_structured_data, indent=2)
+_INVALID_DATA_MESSAGE = "Cannot summarize: Invalid or missing SOW structured data."
+MAX_OUTPUT_TOKENS = 1500
+# The summary only rewrites already-structured data, so it runs on the provider's light model
+MODEL_TIER = "light"
 
-    system_instruction = "You are a professional technical writer and summarizer. Provide a detailed and well-structured summary."
-    user_prompt = f"""
+_SYSTEM_INSTRUCTION = "You are a professional technical writer and summarizer. Provide a detailed and well-structured summary."
+_PROMPT_TEMPLATE = string.Template("""
     Based on the following structured Scope of Work (SOW) data, generate a comprehensive and detailed natural language summary.
     The summary should be professional, concise, and highlight all critical aspects.
     Organize it logically with clear headings or bullet points where appropriate.
@@ -23,14 +20,52 @@ def analysis_agent_run(sow_structured_data: dict, llm_choice: str = "openai") ->
 
     Structured SOW Data:
     ---
-    {sow_json_str}
+    $sow_json_str
     ---
 
     Detailed Summary:
+    """)
+
+
+def _build_slots(sow_structured_data: dict) -> dict:
+    """Builds the template slot values for the summary prompt; the data is embedded as compact JSON to save input tokens."""
+    return {"sow_json_str": json_utils.dumps(sow_structured_data)}
+
+
+def analysis_agent_run(sow_structured_data: dict, llm_choice: str = "openai", refresh: bool = False) -> str:
+    """
+    Agent responsible for generating a detailed natural language summary from structured SOW data.
+    This acts as the primary "analysis" output for the MVP.
+    Set refresh=True to bypass the response cache.
     """
-    messages = [
-        {"role": "system", "content": system_instruction},
-        {"role": "user", "content": user_prompt}
-    ]
+    if not sow_structured_data or sow_structured_data.get("error"):
+        return _INVALID_DATA_MESSAGE
+
+    return run_prompt(_SYSTEM_INSTRUCTION, _PROMPT_TEMPLATE, _build_slots(sow_structured_data),
+                      response_format="text", llm_choice=llm_choice, prompt_cache_key="sow_summary_v1", max_out=MAX_OUTPUT_TOKENS,
+                      model_tier=MODEL_TIER, refresh=refresh)
+
+
+async def analysis_agent_run_async(sow_structured_data: dict, llm_choice: str = "openai", refresh: bool = False) -> str:
+    """
+    Async variant of analysis_agent_run, so the summary can be generated concurrently with the proposal.
+    """
+    if not sow_structured_data or sow_structured_data.get("error"):
+        return _INVALID_DATA_MESSAGE
+
+    return await run_prompt_async(_SYSTEM_INSTRUCTION, _PROMPT_TEMPLATE, _build_slots(sow_structured_data),
+                                  response_format="text", llm_choice=llm_choice, prompt_cache_key="sow_summary_v1", max_out=MAX_OUTPUT_TOKENS,
+                                  model_tier=MODEL_TIER, refresh=refresh)
+
+
+def analysis_agent_stream(sow_structured_data: dict, llm_choice: str = "openai", refresh: bool = False):
+    """
+    Streaming variant of analysis_agent_run; yields the summary in chunks as it is generated.
+    """
+    if not sow_structured_data or sow_structured_data.get("error"):
+        yield _INVALID_DATA_MESSAGE
+        return
 
-    return _call_llm(messages, response_format="text", llm_choice=llm_choice)
\ No newline at end of file
+    yield from run_prompt_stream(_SYSTEM_INSTRUCTION, _PROMPT_TEMPLATE, _build_slots(sow_structured_data),
+                                 response_format="text", llm_choice=llm_choice, prompt_cache_key="sow_summary_v1", max_out=MAX_OUTPUT_TOKENS,
+                                 model_tier=MODEL_TIER, refresh=refresh)
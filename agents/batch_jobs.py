@@ -0,0 +1,119 @@
+# --- agents/batch_jobs.py ---
+# Non-interactive bulk runs of the agents' prompts through the OpenAI Batch API.
+# Batch jobs are billed at a discount and do not count against the synchronous rate limits,
+# at the cost of up to 24h turnaround; interactive use should call the agents directly.
+
+from agents import json_utils, token_utils
+from agents import data_extraction_agent, proposal_generation_agent
+import agents.llm_connector as llm_connector
+
+BATCH_ENDPOINT = "/v1/chat/completions"
+BATCH_COMPLETION_WINDOW = "24h"
+
+# Per stage: how an input becomes a prompt, the request options, the model tier, and how a response is parsed.
+# "extraction" takes raw SOW text (truncated to one extraction budget, not chunked);
+# "proposal" takes structured SOW data as returned by the extraction stage.
+_STAGES = {
+    "extraction": dict(
+        system_instruction=data_extraction_agent._SYSTEM_INSTRUCTION,
+        template=data_extraction_agent._PROMPT_TEMPLATE,
+        build_slots=lambda sow_text: {"sow_text_limited": token_utils.truncate_to_tokens(
+            sow_text, data_extraction_agent.SOW_TOKEN_BUDGET, llm_choice="openai")},
+        options=dict(response_format="json_object", prompt_cache_key="sow_extract_v1",
+                     max_out=data_extraction_agent.MAX_OUTPUT_TOKENS, response_schema=data_extraction_agent.RESPONSE_SCHEMA),
+        model_tier=data_extraction_agent.MODEL_TIER,
+        parse=lambda content, sow_text: data_extraction_agent._parse_response(content)
+    ),
+    "proposal": dict(
+        system_instruction=proposal_generation_agent._SYSTEM_INSTRUCTION,
+        template=proposal_generation_agent._PROMPT_TEMPLATE,
+        build_slots=proposal_generation_agent._build_slots,
+        options=dict(response_format="text", prompt_cache_key="sow_proposal_v2",
+                     max_out=proposal_generation_agent.MAX_OUTPUT_TOKENS, response_schema=None),
+        model_tier="default",
+        parse=proposal_generation_agent._finish_proposal
+    ),
+}
+
+
+def _batch_line(custom_id: str, stage: dict, stage_input) -> str:
+    """Builds one JSON Lines request of a batch input file."""
+    messages = llm_connector.build_messages(stage["system_instruction"], stage["template"], stage["build_slots"](stage_input))
+    options = stage["options"]
+    body = llm_connector._openai_request(messages, options["response_format"], options["prompt_cache_key"], options["max_out"],
+                                         options["response_schema"], llm_connector.MODELS["openai"][stage["model_tier"]])
+    body.update(body.pop("extra_body") or {}) # extra_body is an SDK option; in a batch file its fields go in the body itself
+    body = {key: value for key, value in body.items() if value is not None}
+    return json_utils.dumps({"custom_id": custom_id, "method": "POST", "url": BATCH_ENDPOINT, "body": body})
+
+
+def submit_batch(inputs: dict, stage: str) -> str:
+    """
+    Uploads one request per input and starts an OpenAI batch job.
+    Args:
+        inputs (dict): Maps a caller-chosen id (e.g. a file name) to the stage input:
+            SOW text for "extraction", structured SOW data for "proposal".
+        stage (str): "extraction" or "proposal".
+    Returns:
+        str: The batch id to pass to collect_batch, or an error message starting with "Error:".
+    """
+    if stage not in _STAGES:
+        return f"Error: Unknown batch stage '{stage}'. Must be one of {', '.join(_STAGES)}."
+    if not llm_connector.is_ready("openai"):
+        return "Error: OpenAI client not initialized. Batch jobs require initialize_llm_clients('openai')."
+    try:
+        batch_file = "\n".join(_batch_line(str(custom_id), _STAGES[stage], stage_input) for custom_id, stage_input in inputs.items())
+        uploaded = llm_connector.openai_client.files.create(file=(f"sow_{stage}_batch.jsonl", batch_file.encode("utf-8")), purpose="batch")
+        batch = llm_connector.openai_client.batches.create(input_file_id=uploaded.id, endpoint=BATCH_ENDPOINT,
+                                                           completion_window=BATCH_COMPLETION_WINDOW)
+        return batch.id
+    except Exception as e:
+        print(f"Error submitting {stage} batch: {e}")
+        return f"Error: {e}"
+
+
+def collect_batch(batch_id: str, stage: str, inputs: dict):
+    """
+    Fetches the results of a batch job started by submit_batch.
+    Args:
+        batch_id (str): The id returned by submit_batch.
+        stage (str): The stage the batch was submitted for.
+        inputs (dict): The inputs passed to submit_batch; proposals are completed from their structured SOW data.
+    Returns:
+        dict: Maps each input id to its parsed result (a structured SOW dict for "extraction",
+        proposal Markdown for "proposal"), or to {"error": ...} for requests that failed.
+        str: An error message starting with "Error:" if the job itself failed (kept out of the
+        results dict so it cannot collide with an input id).
+        None: While the job is still running.
+    """
+    try:
+        batch = llm_connector.openai_client.batches.retrieve(batch_id)
+        if batch.status in ("failed", "expired", "cancelled"):
+            return f"Error: Batch {batch_id} ended with status '{batch.status}'."
+        if batch.status != "completed":
+            return None
+
+        results = {}
+        parse = _STAGES[stage]["parse"]
+        inputs = {str(custom_id): stage_input for custom_id, stage_input in inputs.items()}
+        # A completed batch in which every request failed has no output file
+        if batch.output_file_id:
+            for line in llm_connector.openai_client.files.content(batch.output_file_id).text.splitlines():
+                if not line.strip():
+                    continue
+                entry = json_utils.loads(line)
+                response = entry.get("response") or {}
+                if entry.get("error") or response.get("status_code") != 200:
+                    results[entry["custom_id"]] = {"error": str(entry.get("error") or response.get("body"))}
+                else:
+                    results[entry["custom_id"]] = parse(response["body"]["choices"][0]["message"]["content"], inputs[entry["custom_id"]])
+        # Requests rejected before running land in a separate error file
+        if batch.error_file_id:
+            for line in llm_connector.openai_client.files.content(batch.error_file_id).text.splitlines():
+                if line.strip():
+                    entry = json_utils.loads(line)
+                    results[entry["custom_id"]] = {"error": str(entry.get("error") or (entry.get("response") or {}).get("body"))}
+        return results
+    except Exception as e:
+        print(f"Error collecting batch {batch_id}: {e}")
+        return f"Error: An unexpected error occurred: {e}"
@@ -0,0 +1,110 @@
+# --- agents/combined_agent.py ---
+# Agent that extracts the SOW details, writes the summary and drafts the proposal in a single LLM call.
+
+import string
+
+from agents import json_utils, token_utils
+from agents.data_extraction_agent import RESPONSE_SCHEMA as _STRUCTURED_SCHEMA, SOW_TOKEN_BUDGET, _parse_response
+from agents.proposal_generation_agent import _finish_proposal
+from agents.llm_connector import run_prompt, run_prompt_async # Import the shared prompt runners
+
+# Extraction, summary and proposal caps combined; the SOW is read (prefilled) once instead of three times
+MAX_OUTPUT_TOKENS = 8000
+
+_SYSTEM_INSTRUCTION = "You are an expert SOW analyst, technical writer and senior solution architect. You read a Scope of Work once and return its structured details, a detailed summary and a technical proposal draft as one JSON object. Adhere strictly to the requested schema."
+# The instructions form a stable prompt prefix and the SOW text is appended last.
+_PROMPT_TEMPLATE = string.Template("""
+    Read the Scope of Work (SOW) text at the end of this message carefully and return a JSON object with three keys.
+
+    1. "structured": the key SOW information.
+       - "project_name" and "client_name": strings; use "N/A" if not stated.
+       - "objectives", "scope_of_work" (explicitly INCLUDED work), "out_of_scope" (explicitly EXCLUDED work),
+         "technical_requirements", "key_constraints", "stakeholders", "timeline_overview": lists of strings; use [] if nothing is found
+         and never put "N/A" inside a list.
+       - "deliverables": list of objects, each {"name": "string", "description": "string"}.
+
+    2. "summary": a comprehensive, professional natural language summary of the SOW in Markdown, organized with clear headings or
+       bullet points, covering the project name, client, objectives, scope, deliverables, technical requirements, constraints and timeline.
+
+    3. "proposal": a persuasive technical proposal draft in Markdown that directly addresses the SOW. Do not write a title.
+       Start directly with "## 1. Executive Summary", then "## 2. Understanding the Client's Needs & Objectives" and
+       "## 3. Proposed Solution & Approach". Sections 4 to 6 (Scope of Work, Out of Scope, Key Deliverables) are inserted
+       from the structured details automatically, so go straight from section 3 to "## 7. Technical Architecture & Stack",
+       "## 8. Project Timeline & Phases", "## 9. Project Team & Governance", "## 10. Assumptions and Constraints", "## 11. Next Steps".
+
+    Return only the JSON object.
+
+    SOW Text:
+    ---
+    $sow_text_limited
+    ---
+    """)
+
+RESPONSE_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "structured": _STRUCTURED_SCHEMA,
+        "summary": {"type": "string"},
+        "proposal": {"type": "string"}
+    },
+    "required": ["structured", "summary", "proposal"],
+    "additionalProperties": False
+}
+
+
+def _build_slots(sow_text: str, llm_choice: str) -> dict:
+    """Builds the template slot values; the SOW is truncated to the single-call extraction budget."""
+    return {"sow_text_limited": token_utils.truncate_to_tokens(sow_text, SOW_TOKEN_BUDGET, llm_choice=llm_choice)}
+
+
+def _parse_combined(response_content: str) -> dict:
+    """
+    Splits the combined response into its three outputs.
+    Returns:
+        dict: {"structured": dict, "summary": str, "proposal": str}, or {"error": str} on failure.
+    """
+    try:
+        parsed = json_utils.loads(response_content)
+    except json_utils.JSONDecodeError:
+        print(f"Failed to decode JSON from LLM: {response_content}")
+        return {"error": "Failed to parse LLM response as JSON. Raw LLM output: " + response_content[:500]}
+    if not isinstance(parsed, dict) or parsed.get("error"):
+        return {"error": parsed.get("error") if isinstance(parsed, dict) else "Unexpected LLM response."}
+
+    # The structured part goes through the extraction agent's parser so it is cleaned identically
+    structured = _parse_response(json_utils.dumps(parsed.get("structured") or {}))
+    if structured.get("error"):
+        return structured
+    # The title and sections 4-6 are rendered from the structured data, as on the default proposal path
+    proposal = _finish_proposal(str(parsed.get("proposal") or ""), structured)
+    return {"structured": structured, "summary": str(parsed.get("summary") or ""), "proposal": proposal}
+
+
+def combined_agent_run(sow_text: str, llm_choice: str = "openai", refresh: bool = False) -> dict:
+    """
+    Extracts structured SOW data, a detailed summary and a proposal draft in one LLM round-trip.
+    SOWs longer than the extraction budget are truncated rather than chunked.
+    Set refresh=True to bypass the response cache.
+    Returns:
+        dict: {"structured": dict, "summary": str, "proposal": str}, or {"error": str} on failure.
+    """
+    if not sow_text:
+        return {"error": "No SOW text provided for extraction."}
+
+    response_content = run_prompt(_SYSTEM_INSTRUCTION, _PROMPT_TEMPLATE, _build_slots(sow_text, llm_choice),
+                                  response_format="json_object", llm_choice=llm_choice, prompt_cache_key="sow_combined_v2",
+                                  max_out=MAX_OUTPUT_TOKENS, response_schema=RESPONSE_SCHEMA, refresh=refresh)
+    return _parse_combined(response_content)
+
+
+async def combined_agent_run_async(sow_text: str, llm_choice: str = "openai", refresh: bool = False) -> dict:
+    """
+    Async variant of combined_agent_run, using the async provider clients on the shared LLM event loop.
+    """
+    if not sow_text:
+        return {"error": "No SOW text provided for extraction."}
+
+    response_content = await run_prompt_async(_SYSTEM_INSTRUCTION, _PROMPT_TEMPLATE, _build_slots(sow_text, llm_choice),
+                                              response_format="json_object", llm_choice=llm_choice, prompt_cache_key="sow_combined_v2",
+                                              max_out=MAX_OUTPUT_TOKENS, response_schema=RESPONSE_SCHEMA, refresh=refresh)
+    return _parse_combined(response_content)
@@ -1,21 +1,33 @@
 # --- agents/data_extraction_agent.py ---
 # Agent responsible for extracting structured information from raw SOW text.
 
-import json
-from agents.llm_connector import _call_llm # Import the shared LLM caller
+import asyncio
+import operator
+import string
+from typing import Optional
 
-def data_extraction_agent_run(sow_text: str, llm_choice: str = "openai") -> dict:
-    """
-    Agent responsible for extracting structured information from raw SOW text.
-    """
-    if not sow_text:
-        return {"error": "No SOW text provided for extraction."}
+from agents import json_utils, token_utils
+from agents.llm_connector import run_prompt, run_prompt_async # Import the shared prompt runners
 
-    sow_text_limited = sow_text[:15000] # Limit input to manage token costs
+try:
+    import msgspec
+except ImportError:  # msgspec is optional; responses are then parsed by the lenient path only
+    msgspec = None
 
-    system_instruction = "You are an expert AI assistant specialized in analyzing Scope of Work (SOW) documents. Your goal is to extract precise and comprehensive information into a structured JSON object. Adhere strictly to the requested schema and data types."
-    user_prompt = f"""
-    Read the following Scope of Work (SOW) text carefully and extract ALL the key information into a structured JSON object.
+# Truncated JSON cannot be parsed at all, so this cap leaves headroom for long SOWs
+MAX_OUTPUT_TOKENS = 2500
+# SOW input budget in tokens per extraction call; unlike a character cap, this does not depend on how token-dense the SOW is
+SOW_TOKEN_BUDGET = 6000
+# Longer SOWs are split into up to this many chunks, extracted in parallel and merged; the rest is truncated
+MAX_SOW_CHUNKS = 4
+# Extraction is schema-constrained (strict JSON schema / response_schema), so it runs on the provider's light model
+MODEL_TIER = "light"
+
+_SYSTEM_INSTRUCTION = "You are an expert AI assistant specialized in analyzing Scope of Work (SOW) documents. Your goal is to extract precise and comprehensive information into a structured JSON object. Adhere strictly to the requested schema and data types."
+# Instructions and schema come first so they form a stable, cacheable prompt prefix;
+# the SOW text is appended last.
+_PROMPT_TEMPLATE = string.Template("""
+    Read the Scope of Work (SOW) text at the end of this message carefully and extract ALL the key information into a structured JSON object.
     Be precise, comprehensive, and accurate.
 
     **Strict JSON Schema Adherence:**
@@ -28,71 +40,270 @@ def data_extraction_agent_run(sow_text: str, llm_choice: str = "openai") -> dict
     - **"client_name"**: Identify the full name of the client or organization issuing the SOW. Look for "Client:", "Customer:", "Issued By:", "For:", "Organization Name:", or the primary entity requesting the work.
     - **"timeline_overview"**: Extract descriptions of project duration, phases, key milestones, or important dates. This should be a list of strings.
 
-    SOW Text:
-    ---
-    {sow_text_limited}
-    ---
-
     Extract the following fields into a JSON object:
     - "project_name": (string)
     - "client_name": (string)
     - "objectives": (list of strings) Concise main goals or aims of the project.
     - "scope_of_work": (list of strings) Detailed summary of activities, tasks, and responsibilities explicitly INCLUDED.
     - "out_of_scope": (list of strings) Detailed summary of activities, tasks, or responsibilities explicitly EXCLUDED.
-    - "deliverables": (list of objects) Tangible outputs/results. Each object: {{"name": "string", "description": "string"}}.
-      Example: {{"name": "Phase 1 Report", "description": "Detailed analysis and recommendations"}}
+    - "deliverables": (list of objects) Tangible outputs/results. Each object: {"name": "string", "description": "string"}.
+      Example: {"name": "Phase 1 Report", "description": "Detailed analysis and recommendations"}
     - "technical_requirements": (list of strings) Specific technologies, platforms, tools, standards, or methodologies.
     - "key_constraints": (list of strings) Significant limitations, assumptions, risks, or conditions.
     - "stakeholders": (list of strings) Key roles, teams, or departments involved (client and vendor side).
     - "timeline_overview": (list of strings) Project duration, phases, or key milestones.
 
     Return only the JSON object.
+
+    SOW Text:
+    ---
+    $sow_text_limited
+    ---
+    """)
+
+# Placeholder values the LLM uses for "nothing found", compared after casefold()
+_NA_VALUES = frozenset({"n/a", "na", "none", ""})
+_LIST_KEYS = ("objectives", "scope_of_work", "out_of_scope", "technical_requirements",
+              "key_constraints", "stakeholders", "timeline_overview")
+_STR_KEYS = ("project_name", "client_name")
+_get_struct_strings = operator.attrgetter(*_STR_KEYS)
+
+# JSON Schema sent with the request so the provider constrains its output to this shape.
+# Strict structured outputs require every property to be listed and no extra keys.
+_STRING_LIST_SCHEMA = {"type": "array", "items": {"type": "string"}}
+RESPONSE_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "project_name": {"type": "string"},
+        "client_name": {"type": "string"},
+        "objectives": _STRING_LIST_SCHEMA,
+        "scope_of_work": _STRING_LIST_SCHEMA,
+        "out_of_scope": _STRING_LIST_SCHEMA,
+        "deliverables": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {"name": {"type": "string"}, "description": {"type": "string"}},
+                "required": ["name", "description"],
+                "additionalProperties": False
+            }
+        },
+        "technical_requirements": _STRING_LIST_SCHEMA,
+        "key_constraints": _STRING_LIST_SCHEMA,
+        "stakeholders": _STRING_LIST_SCHEMA,
+        "timeline_overview": _STRING_LIST_SCHEMA
+    },
+    "required": [*_STR_KEYS, *_LIST_KEYS, "deliverables"],
+    "additionalProperties": False
+}
+
+if msgspec is not None:
+    class Deliverable(msgspec.Struct):
+        name: str
+        description: str = "Not detailed by AI"
+
+    class SOWSchema(msgspec.Struct):
+        """Typed shape of the extraction response; decoding validates it in a single pass."""
+        project_name: str = "N/A"
+        client_name: str = "N/A"
+        objectives: list[str] = []
+        scope_of_work: list[str] = []
+        out_of_scope: list[str] = []
+        deliverables: list[Deliverable] = []
+        technical_requirements: list[str] = []
+        key_constraints: list[str] = []
+        stakeholders: list[str] = []
+        timeline_overview: list[str] = []
+        error: Optional[str] = None # Set when _call_llm reports a failure
+
+    _DECODER = msgspec.json.Decoder(SOWSchema)
+
+
+def _ensure_list_of_strings(field_value) -> list:
+    """Returns the string items of field_value without "N/A" placeholders, or [] if it is not a list."""
+    if not isinstance(field_value, list):
+        return []
+    return [item for item in field_value if isinstance(item, str) and item.casefold() not in _NA_VALUES]
+
+
+def _clean_string_field(value) -> str:
+    """Returns value if it is a non-placeholder string, otherwise "N/A"."""
+    return value if isinstance(value, str) and value.casefold() not in _NA_VALUES else "N/A"
+
+
+def _is_deliverable_name(name) -> bool:
+    """Returns True if name is a string that is neither blank nor an "N/A" placeholder."""
+    return isinstance(name, str) and name.strip().casefold() not in _NA_VALUES
+
+
+def _clean_deliverables(raw_deliverables) -> list:
     """
-    messages = [
-        {"role": "system", "content": system_instruction},
-        {"role": "user", "content": user_prompt}
-    ]
+    Normalizes a raw "deliverables" value into a list of {"name", "description"} dicts.
+    A well-formed list is validated in one msgspec pass; anything else is repaired item by item.
+    """
+    if msgspec is not None:
+        try:
+            deliverables = msgspec.convert(raw_deliverables, list[Deliverable])
+        except msgspec.ValidationError:
+            pass
+        else:
+            return [msgspec.structs.asdict(d) for d in deliverables if _is_deliverable_name(d.name)]
+
+    cleaned_deliverables = []
+    if isinstance(raw_deliverables, list):
+        for item in raw_deliverables:
+            if isinstance(item, dict):
+                # A null, empty or non-string name cannot be displayed or de-duplicated, so the item is dropped
+                name = item.get("name")
+                if _is_deliverable_name(name):
+                    description = item.get("description")
+                    cleaned_deliverables.append({"name": name, "description": description if isinstance(description, str) else "Not detailed by AI"})
+            elif _is_deliverable_name(item):
+                # If LLM returns a list of strings for deliverables, convert to expected format
+                cleaned_deliverables.append({"name": item, "description": "Not detailed by AI"})
+    return cleaned_deliverables
+
 
-    response_content = _call_llm(messages, response_format="json_object", llm_choice=llm_choice)
+def _parse_strict(response_content: str):
+    """
+    Decodes and validates a well-formed extraction response against SOWSchema.
+    Returns:
+        dict: The cleaned SOW data, or None if msgspec is unavailable or the response
+        does not match the schema (the caller then falls back to _parse_lenient).
+    """
+    if msgspec is None:
+        return None
     try:
-        parsed_data = json.loads(response_content)
-
-        # --- Post-deserialization cleanup for list fields and string fields ---
-        # Helper to ensure a field is a list of strings, converting if necessary and cleaning "N/A"
-        def ensure_list_of_strings(field_value):
-            if isinstance(field_value, list):
-                cleaned_list = [item for item in field_value if isinstance(item, str) and item.lower() != "n/a"]
-                return cleaned_list
-            elif isinstance(field_value, str) and field_value.lower() == "n/a":
-                return []
-            return []
-
-        # Apply cleanup to all list fields
-        for key in ["objectives", "scope_of_work", "out_of_scope", "technical_requirements",
-                     "key_constraints", "stakeholders", "timeline_overview"]:
-            parsed_data[key] = ensure_list_of_strings(parsed_data.get(key))
-
-        # Special handling for Deliverables (List of Maps)
-        cleaned_deliverables = []
-        raw_deliverables = parsed_data.get("deliverables")
-        if isinstance(raw_deliverables, list):
-            for item in raw_deliverables:
-                if isinstance(item, dict) and "name" in item and "description" in item:
-                    cleaned_deliverables.append(item)
-                elif isinstance(item, str) and item.lower() != "n/a":
-                    # If LLM returns a list of strings for deliverables, convert to expected format
-                    cleaned_deliverables.append({"name": item, "description": "Not detailed by AI"})
-        parsed_data["deliverables"] = cleaned_deliverables
-
-        # Basic validation for single string fields to ensure they are not null or empty
-        for key in ["project_name", "client_name"]:
-            if not parsed_data.get(key) or (isinstance(parsed_data.get(key), str) and parsed_data.get(key).lower() == "n/a"):
-                parsed_data[key] = "N/A"
+        parsed = _DECODER.decode(response_content)
+    except msgspec.DecodeError: # Also covers msgspec.ValidationError
+        return None
+    if parsed.error:
+        return {"error": parsed.error}
+
+    for key in _LIST_KEYS:
+        setattr(parsed, key, _ensure_list_of_strings(getattr(parsed, key)))
+    parsed.deliverables = [d for d in parsed.deliverables if _is_deliverable_name(d.name)]
+    for key, value in zip(_STR_KEYS, _get_struct_strings(parsed)):
+        setattr(parsed, key, _clean_string_field(value))
+
+    parsed_data = msgspec.to_builtins(parsed)
+    del parsed_data["error"]
+    return parsed_data
+
+
+def _parse_lenient(response_content: str) -> dict:
+    """
+    Parses an extraction response that does not match SOWSchema exactly, coercing
+    or dropping malformed fields.
+    Raises:
+        json_utils.JSONDecodeError: If the response is not valid JSON.
+    """
+    parsed_data = json_utils.loads(response_content)
+
+    # --- Post-deserialization cleanup for list fields and string fields ---
+    # Apply cleanup to all list fields
+    for key in _LIST_KEYS:
+        parsed_data[key] = _ensure_list_of_strings(parsed_data.get(key))
+
+    # Special handling for Deliverables (List of Maps)
+    parsed_data["deliverables"] = _clean_deliverables(parsed_data.get("deliverables"))
+
+    # Basic validation for single string fields to ensure they are not null or empty
+    # map(dict.get) rather than itemgetter, since the LLM may omit a key entirely
+    for key, value in zip(_STR_KEYS, map(parsed_data.get, _STR_KEYS)):
+        parsed_data[key] = _clean_string_field(value)
 
+    return parsed_data
+
+
+def _parse_response(response_content: str) -> dict:
+    """Parses the extraction response into cleaned SOW data, or an error dict on failure."""
+    try:
+        parsed_data = _parse_strict(response_content)
+        if parsed_data is None:
+            parsed_data = _parse_lenient(response_content)
         return parsed_data
-    except json.JSONDecodeError:
+    except json_utils.JSONDecodeError:
         print(f"Failed to decode JSON from LLM: {response_content}")
         return {"error": "Failed to parse LLM response as JSON. Raw LLM output: " + response_content[:500]}
     except Exception as e:
         print(f"An unexpected error occurred during SOW analysis: {e}")
-        return {"error": f"An unexpected error occurred: {e}"}
\ No newline at end of file
+        return {"error": f"An unexpected error occurred: {e}"}
+
+
+def _split_sow(sow_text: str, llm_choice: str) -> list:
+    """Splits the SOW into at most MAX_SOW_CHUNKS chunks of SOW_TOKEN_BUDGET tokens each."""
+    sow_text_limited = token_utils.truncate_to_tokens(sow_text, SOW_TOKEN_BUDGET * MAX_SOW_CHUNKS, llm_choice=llm_choice) # Limit input to manage token costs
+    chunks = token_utils.chunk_text(sow_text_limited, SOW_TOKEN_BUDGET, llm_choice=llm_choice)
+    # Packing can leave a short remainder past the last full chunk; it is folded into that chunk
+    # rather than paying for an extra extraction call
+    if len(chunks) > MAX_SOW_CHUNKS:
+        chunks[MAX_SOW_CHUNKS - 1:] = ["".join(chunks[MAX_SOW_CHUNKS - 1:])]
+    return chunks
+
+
+def _merge_extractions(parts: list) -> dict:
+    """
+    Merges the extractions of consecutive SOW chunks: the first real value wins for scalar
+    fields, and list fields are concatenated with case-insensitive duplicates removed.
+    Returns the first error only if every chunk failed.
+    """
+    successful = [part for part in parts if not part.get("error")]
+    if not successful:
+        return parts[0]
+    if len(successful) == 1:
+        return successful[0]
+
+    merged = {key: next((part[key] for part in successful if part[key] != "N/A"), "N/A") for key in _STR_KEYS}
+    for key in _LIST_KEYS:
+        seen = set()
+        merged[key] = [item for part in successful for item in part[key]
+                       if item.casefold() not in seen and not seen.add(item.casefold())]
+    seen = set()
+    merged["deliverables"] = [d for part in successful for d in part["deliverables"]
+                              if isinstance(d.get("name"), str) # Defensive: skip entries no parser should have kept
+                              and d["name"].casefold() not in seen and not seen.add(d["name"].casefold())]
+    return merged
+
+
+def _build_slots(sow_chunk: str) -> dict:
+    """Builds the template slot values for the extraction prompt."""
+    return {"sow_text_limited": sow_chunk}
+
+
+def _extract_chunk(sow_chunk: str, llm_choice: str, refresh: bool) -> dict:
+    response_content = run_prompt(_SYSTEM_INSTRUCTION, _PROMPT_TEMPLATE, _build_slots(sow_chunk),
+                                  response_format="json_object", llm_choice=llm_choice, prompt_cache_key="sow_extract_v1",
+                                  max_out=MAX_OUTPUT_TOKENS, response_schema=RESPONSE_SCHEMA, model_tier=MODEL_TIER, refresh=refresh)
+    return _parse_response(response_content)
+
+
+async def _extract_chunk_async(sow_chunk: str, llm_choice: str, refresh: bool) -> dict:
+    response_content = await run_prompt_async(_SYSTEM_INSTRUCTION, _PROMPT_TEMPLATE, _build_slots(sow_chunk),
+                                              response_format="json_object", llm_choice=llm_choice, prompt_cache_key="sow_extract_v1",
+                                              max_out=MAX_OUTPUT_TOKENS, response_schema=RESPONSE_SCHEMA, model_tier=MODEL_TIER, refresh=refresh)
+    return _parse_response(response_content)
+
+
+def data_extraction_agent_run(sow_text: str, llm_choice: str = "openai", refresh: bool = False) -> dict:
+    """
+    Agent responsible for extracting structured information from raw SOW text.
+    SOWs longer than SOW_TOKEN_BUDGET are extracted chunk by chunk and the results merged.
+    Set refresh=True to bypass the response cache.
+    """
+    if not sow_text:
+        return {"error": "No SOW text provided for extraction."}
+
+    return _merge_extractions([_extract_chunk(chunk, llm_choice, refresh) for chunk in _split_sow(sow_text, llm_choice)])
+
+
+async def data_extraction_agent_run_async(sow_text: str, llm_choice: str = "openai", refresh: bool = False) -> dict:
+    """
+    Async variant of data_extraction_agent_run, using the async provider clients on the shared LLM event loop.
+    Chunks of a long SOW are extracted concurrently.
+    """
+    if not sow_text:
+        return {"error": "No SOW text provided for extraction."}
+
+    parts = await asyncio.gather(*(_extract_chunk_async(chunk, llm_choice, refresh) for chunk in _split_sow(sow_text, llm_choice)))
+    return _merge_extractions(list(parts))
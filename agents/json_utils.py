@@ -0,0 +1,41 @@
+# --- agents/json_utils.py ---
+# Shared JSON helpers for the agents. Uses orjson when it is installed and
+# degrades gracefully to the standard library otherwise.
+
+import json
+
+try:
+    import orjson
+except ImportError:  # orjson is optional; the stdlib path behaves identically
+    orjson = None
+
+# orjson.JSONDecodeError subclasses json.JSONDecodeError, so callers can catch this for both backends
+JSONDecodeError = json.JSONDecodeError
+
+
+def dumps(obj, indent: bool = False) -> str:
+    """
+    Serializes obj to a JSON string.
+    Args:
+        obj: Any JSON-serializable object.
+        indent (bool): Pretty-print with two-space indentation.
+    Returns:
+        str: The JSON document.
+    """
+    if orjson is not None:
+        return orjson.dumps(obj, option=orjson.OPT_INDENT_2 if indent else 0).decode()
+    # Same output as orjson: compact separators and non-ASCII characters left unescaped
+    if indent:
+        return json.dumps(obj, indent=2, ensure_ascii=False)
+    return json.dumps(obj, separators=(",", ":"), ensure_ascii=False)
+
+
+def loads(data):
+    """
+    Parses a JSON document from a str or bytes object.
+    Raises:
+        JSONDecodeError: If the document is not valid JSON.
+    """
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
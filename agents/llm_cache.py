@@ -0,0 +1,332 @@
+# --- agents/llm_cache.py ---
+# Response cache for LLM calls. An exact-match tier keyed by a hash of the full request
+# always runs; an optional semantic tier returns the response of a near-duplicate prompt.
+
+import asyncio
+import functools
+import hashlib
+import inspect
+import math
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from agents import json_utils
+
+EXACT_CACHE_SIZE = 256
+# Exact-match entries are persisted here so re-analysing an unchanged SOW costs nothing after a restart
+EXACT_CACHE_PERSIST = os.getenv("LLM_CACHE_PERSIST", "true").lower() == "true"
+EXACT_CACHE_DIR = os.getenv("LLM_CACHE_DIR", os.path.join(".cache", "llm_responses"))
+# Persisted responses older than this are treated as misses and dropped on the next start-up (both tiers)
+EXACT_CACHE_TTL_SECONDS = 7 * 24 * 60 * 60
+# The semantic tier costs one embedding call per miss and can match prompts that differ
+# in small but meaningful details, so it is opt-in.
+SEMANTIC_CACHE_ENABLED = os.getenv("LLM_SEMANTIC_CACHE", "false").lower() == "true"
+# Cosine similarity a prompt must reach to reuse a response; raise it for stricter matching of template-driven SOWs
+SEMANTIC_SIMILARITY_THRESHOLD = float(os.getenv("LLM_SEMANTIC_CACHE_THRESHOLD", "0.95"))
+SEMANTIC_CACHE_SIZE = 128
+# Semantic entries are persisted here so near-duplicate SOWs still hit after a restart
+SEMANTIC_CACHE_DIR = os.getenv("LLM_SEMANTIC_CACHE_DIR", os.path.join(".cache", "sow_embeddings"))
+# clear_caches() wipes the cache of every session, so the app only offers it to an operator who opts in
+CLEAR_CACHE_BUTTON_ENABLED = os.getenv("LLM_CACHE_ADMIN", "false").lower() == "true"
+
+
+def make_cache_key(request: dict) -> str:
+    """Returns a stable hash of an LLM request (messages plus every call parameter)."""
+    return hashlib.blake2b(json_utils.dumps(request).encode(), digest_size=32).hexdigest()
+
+
+class ExactCache:
+    """
+    Thread-safe LRU mapping of request hashes to LLM responses, with hit/miss counters.
+    Entries expire ttl seconds after they were stored.
+    When path is set, entries are appended to that JSON Lines file and reloaded on start-up.
+    """
+
+    def __init__(self, max_size: int = EXACT_CACHE_SIZE, path: str = None, ttl: float = EXACT_CACHE_TTL_SECONDS):
+        self.max_size = max_size
+        self.path = path
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict() # key -> (value, stored_at)
+        self._lock = threading.Lock()
+        if path:
+            self._load()
+
+    def _load(self):
+        """Reads persisted entries, compacting the file if it holds more than max_size of them."""
+        line_count = 0
+        try:
+            with open(self.path, encoding="utf-8") as cache_file:
+                for line in cache_file:
+                    line_count += 1
+                    try:
+                        entry = json_utils.loads(line)
+                    except json_utils.JSONDecodeError: # e.g. a line cut short by a crash mid-write
+                        continue
+                    stored_at = entry.get("stored_at", time.time())
+                    if time.time() - stored_at < self.ttl:
+                        self._entries[entry["key"]] = (entry["value"], stored_at)
+                        self._entries.move_to_end(entry["key"])
+        except FileNotFoundError:
+            return
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+        if line_count > len(self._entries):
+            with open(self.path, "w", encoding="utf-8") as cache_file:
+                for key, (value, stored_at) in self._entries.items():
+                    cache_file.write(self._serialize(key, value, stored_at))
+
+    @staticmethod
+    def _serialize(key: str, value: str, stored_at: float) -> str:
+        return json_utils.dumps({"key": key, "value": value, "stored_at": stored_at}) + "\n"
+
+    def get(self, key: str):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and time.time() - entry[1] >= self.ttl:
+                del self._entries[key]
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._entries.move_to_end(key)
+            return entry[0]
+
+    def set(self, key: str, value: str):
+        stored_at = time.time()
+        with self._lock:
+            self._entries[key] = (value, stored_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+            if self.path:
+                try:
+                    os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+                    with open(self.path, "a", encoding="utf-8") as cache_file:
+                        cache_file.write(self._serialize(key, value, stored_at))
+                except OSError as e:
+                    print(f"Could not persist LLM cache entry: {e}")
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            if self.path and os.path.exists(self.path):
+                os.remove(self.path)
+
+
+def _normalize(vector: list) -> list:
+    norm = math.sqrt(sum(x * x for x in vector)) or 1.0
+    return [x / norm for x in vector]
+
+
+class SemanticCache:
+    """
+    Stores (embedding, response) pairs per namespace and returns the response whose
+    prompt embedding has the highest cosine similarity above the threshold, counting hits and misses.
+    Namespaces keep responses from different providers/models/formats apart.
+    Entries expire ttl seconds after they were stored.
+    When path is set, entries are appended to that JSON Lines file and reloaded on start-up.
+    """
+
+    def __init__(self, threshold: float = SEMANTIC_SIMILARITY_THRESHOLD, max_size: int = SEMANTIC_CACHE_SIZE, path: str = None,
+                 ttl: float = EXACT_CACHE_TTL_SECONDS):
+        self.threshold = threshold
+        self.max_size = max_size
+        self.path = path
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries = {} # namespace -> [(embedding, value, stored_at)]
+        self._lock = threading.Lock()
+        if path:
+            self._load()
+
+    def _load(self):
+        """Reads persisted entries, compacting the file if it holds expired entries or more than max_size per namespace."""
+        line_count = 0
+        try:
+            with open(self.path, encoding="utf-8") as cache_file:
+                for line in cache_file:
+                    line_count += 1
+                    try:
+                        entry = json_utils.loads(line)
+                    except json_utils.JSONDecodeError: # e.g. a line cut short by a crash mid-write
+                        continue
+                    # Entries persisted before stored_at was recorded count as expired
+                    stored_at = entry.get("stored_at", 0.0)
+                    if time.time() - stored_at < self.ttl:
+                        self._entries.setdefault(entry["namespace"], []).append((entry["embedding"], entry["value"], stored_at))
+        except FileNotFoundError:
+            return
+        for entries in self._entries.values():
+            del entries[:-self.max_size]
+        if line_count > sum(len(entries) for entries in self._entries.values()):
+            with open(self.path, "w", encoding="utf-8") as cache_file:
+                for namespace, entries in self._entries.items():
+                    for vector, value, stored_at in entries:
+                        cache_file.write(self._serialize(namespace, vector, value, stored_at))
+
+    @staticmethod
+    def _serialize(namespace: str, vector: list, value: str, stored_at: float) -> str:
+        return json_utils.dumps({"namespace": namespace, "embedding": vector, "value": value, "stored_at": stored_at}) + "\n"
+
+    def get(self, namespace: str, embedding: list):
+        query = _normalize(embedding)
+        best_score, best_value = self.threshold, None
+        now = time.time()
+        with self._lock:
+            entries = self._entries.get(namespace)
+            if entries:
+                entries[:] = [entry for entry in entries if now - entry[2] < self.ttl]
+            entries = list(entries or ())
+        for vector, value, _ in entries:
+            score = sum(a * b for a, b in zip(query, vector))
+            if score >= best_score:
+                best_score, best_value = score, value
+        with self._lock:
+            if best_value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return best_value
+
+    def set(self, namespace: str, embedding: list, value: str):
+        vector = _normalize(embedding)
+        stored_at = time.time()
+        with self._lock:
+            entries = self._entries.setdefault(namespace, [])
+            entries.append((vector, value, stored_at))
+            del entries[:-self.max_size]
+            if self.path:
+                try:
+                    os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+                    with open(self.path, "a", encoding="utf-8") as cache_file:
+                        cache_file.write(self._serialize(namespace, vector, value, stored_at))
+                except OSError as e:
+                    print(f"Could not persist semantic cache entry: {e}")
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            if self.path and os.path.exists(self.path):
+                os.remove(self.path)
+
+
+exact_cache = ExactCache(path=os.path.join(EXACT_CACHE_DIR, "entries.jsonl") if EXACT_CACHE_PERSIST else None)
+semantic_cache = SemanticCache(path=os.path.join(SEMANTIC_CACHE_DIR, "entries.jsonl") if SEMANTIC_CACHE_ENABLED else None)
+
+
+def clear_caches():
+    """Empties both cache tiers."""
+    exact_cache.clear()
+    semantic_cache.clear()
+
+
+def cached_llm_call(embed_fn=None):
+    """
+    Decorator that caches the string result of a sync or async LLM call function taking a
+    `messages` argument. Every argument is part of the exact-match key. When the semantic
+    tier is enabled, embed_fn(text, llm_choice=...) must return an embedding of the user
+    messages. Pass refresh_cache=True to skip the lookup and store a fresh response.
+    Exceptions raised by the wrapped function are never cached.
+    """
+    def decorator(func):
+        signature = inspect.signature(func)
+
+        def lookup(args, kwargs, refresh_cache):
+            bound = signature.bind(*args, **kwargs)
+            bound.apply_defaults()
+            request = dict(bound.arguments)
+            key = make_cache_key(request)
+            cached = None if refresh_cache else exact_cache.get(key)
+            return request, key, cached
+
+        def semantic_query(request):
+            other_args = {k: v for k, v in request.items() if k != "messages"}
+            user_text = "\n".join(m["content"] for m in request["messages"] if m["role"] == "user")
+            return make_cache_key(other_args), user_text, other_args.get("llm_choice")
+
+        def semantic_lookup(namespace, embedding, key, refresh_cache):
+            cached = None if refresh_cache else semantic_cache.get(namespace, embedding)
+            if cached is not None:
+                exact_cache.set(key, cached)
+            return cached
+
+        def store(key, result, namespace=None, embedding=None):
+            exact_cache.set(key, result)
+            if embedding is not None:
+                semantic_cache.set(namespace, embedding, result)
+
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, refresh_cache=False, **kwargs):
+                request, key, cached = lookup(args, kwargs, refresh_cache)
+                if cached is not None:
+                    return cached
+                namespace = embedding = None
+                if SEMANTIC_CACHE_ENABLED and embed_fn is not None:
+                    namespace, user_text, llm_choice = semantic_query(request)
+                    try:
+                        embedding = await asyncio.to_thread(embed_fn, user_text, llm_choice=llm_choice)
+                    except Exception as e:
+                        print(f"Semantic cache lookup skipped, embedding failed: {e}")
+                    else:
+                        cached = semantic_lookup(namespace, embedding, key, refresh_cache)
+                        if cached is not None:
+                            return cached
+                result = await func(*args, **kwargs)
+                store(key, result, namespace, embedding)
+                return result
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, refresh_cache=False, **kwargs):
+            request, key, cached = lookup(args, kwargs, refresh_cache)
+            if cached is not None:
+                return cached
+            namespace = embedding = None
+            if SEMANTIC_CACHE_ENABLED and embed_fn is not None:
+                namespace, user_text, llm_choice = semantic_query(request)
+                try:
+                    embedding = embed_fn(user_text, llm_choice=llm_choice)
+                except Exception as e:
+                    print(f"Semantic cache lookup skipped, embedding failed: {e}")
+                else:
+                    cached = semantic_lookup(namespace, embedding, key, refresh_cache)
+                    if cached is not None:
+                        return cached
+            result = func(*args, **kwargs)
+            store(key, result, namespace, embedding)
+            return result
+        return wrapper
+    return decorator
+
+
+def cached_llm_stream(func):
+    """
+    Decorator for async generator functions that stream an LLM response in chunks.
+    Uses the same exact-match keys as cached_llm_call, so a streamed response and a
+    non-streamed call with identical arguments share one cache entry. A cache hit is
+    yielded as a single chunk; a response is stored only once its stream completes.
+    """
+    signature = inspect.signature(func)
+
+    @functools.wraps(func)
+    async def wrapper(*args, refresh_cache=False, **kwargs):
+        bound = signature.bind(*args, **kwargs)
+        bound.apply_defaults()
+        key = make_cache_key(dict(bound.arguments))
+        cached = None if refresh_cache else exact_cache.get(key)
+        if cached is not None:
+            yield cached
+            return
+        chunks = []
+        async for chunk in func(*args, **kwargs):
+            chunks.append(chunk)
+            yield chunk
+        exact_cache.set(key, "".join(chunks))
+    return wrapper
@@ -1,88 +1,606 @@
 # --- agents/llm_connector.py ---
-# Handles LLM client initialization and the core _call_llm logic.
+# Handles LLM client initialization and the core _call_llm logic (sync and async).
 
+import asyncio
+import contextlib
+import importlib.util
 import os
-import json
-from openai import OpenAI
-import google.generativeai as genai
+import random
+import threading
+import time
+from agents import json_utils, llm_cache, token_utils
 
 # Global LLM client instances (initialized by app.py)
 openai_client = None
+openai_async_client = None
 gemini_model = None
+# Provider SDKs are imported on first use, and only for the selected provider, so start-up never
+# loads the (large) SDK of the unused one. They are re-imported where needed rather than kept in
+# module globals: an import is a sys.modules lookup once loaded, and nothing is lost when Streamlit
+# reloads this module while the clients above, cached by app.py, survive.
+
+# Dedicated event loop for async LLM calls. Async clients hold connections bound to the
+# loop that created them, so every coroutine runs on this one long-lived loop rather
+# than on a fresh asyncio.run() loop per Streamlit rerun.
+_event_loop = None
+_event_loop_lock = threading.Lock()
+
+# Upper bound on in-flight async LLM requests, so fan-outs over many prompts queue locally
+# instead of tripping provider rate limits and retrying
+LLM_CONCURRENCY = int(os.getenv("LLM_CONCURRENCY", "4"))
+_request_semaphore = None
+# Optional cap on async LLM requests started per minute (0 = no cap), enforced with a token bucket
+# so sustained fan-outs stay under the provider's RPM limit instead of collecting 429s
+LLM_REQUESTS_PER_MINUTE = int(os.getenv("LLM_REQUESTS_PER_MINUTE", "0"))
+_rate_limiter = None
+# Optional cap on tokens per minute (0 = no cap); each request is charged its prompt tokens plus
+# its max_out before it is sent, so long SOWs are throttled against the account's TPM limit too
+LLM_TOKENS_PER_MINUTE = int(os.getenv("LLM_TOKENS_PER_MINUTE", "0"))
+_token_limiter = None
+
+# Output-token cap used when an agent does not pass its own max_out
+DEFAULT_MAX_OUTPUT_TOKENS = 1500
+# Sampling temperature by response format: JSON responses are factual extraction, so they are
+# made (near-)deterministic, while prose keeps some variety
+TEXT_TEMPERATURE = 0.4
+JSON_TEMPERATURE = 0.0
+
+# Model per provider and tier. "light" is for tasks that only rewrite already-structured data
+# (the summary); extraction and the proposal keep the default model.
+MODELS = {
+    "openai": {"default": os.getenv("OPENAI_MODEL", "gpt-4o"), "light": os.getenv("OPENAI_LIGHT_MODEL", "gpt-4o-mini")},
+    "gemini": {"default": os.getenv("GEMINI_MODEL", "gemini-1.5-flash"), "light": os.getenv("GEMINI_LIGHT_MODEL", "gemini-1.5-flash-8b")},
+}
+# Gemini model objects by (name, system instruction), beyond the default gemini_model; created on first use.
+# The agents use a handful of fixed system prompts, so this stays small.
+_gemini_models = {}
+
+# Connection pool for the OpenAI clients; keep-alive connections skip the TLS handshake on repeat calls
+HTTP_MAX_CONNECTIONS = 20
+HTTP_MAX_KEEPALIVE_CONNECTIONS = 10
+# Concurrent requests share one multiplexed HTTP/2 connection when the optional h2 package
+# (pip install "httpx[http2]") is installed; otherwise httpx stays on pooled HTTP/1.1.
+# Gemini's gRPC transport is HTTP/2 already.
+HTTP2_ENABLED = importlib.util.find_spec("h2") is not None
+
+# Every provider request is cut off after REQUEST_TIMEOUT seconds and retried up to MAX_RETRIES
+# times with exponential backoff, so a stalled call cannot leave a spinner running forever
+REQUEST_TIMEOUT = float(os.getenv("LLM_REQUEST_TIMEOUT", "60"))
+MAX_RETRIES = 2
+RETRY_BACKOFF_SECONDS = 1.0
+# After this many consecutive requests to a provider fail with a transient error (retries included),
+# further requests fail fast for CIRCUIT_RESET_SECONDS instead of each waiting out its own timeouts
+CIRCUIT_FAILURE_THRESHOLD = 5
+CIRCUIT_RESET_SECONDS = 30.0
 
 def initialize_llm_clients(llm_choice: str):
     """
     Initializes the global LLM client instances based on the chosen provider.
-    Called once by app.py at startup.
+    Called by app.py through a st.cache_resource wrapper, so it runs once per process.
+    Returns:
+        tuple: (openai_client, openai_async_client, gemini_model)
     """
-    global openai_client, gemini_model
+    global openai_client, openai_async_client, gemini_model
 
     if llm_choice == "openai":
         api_key = os.getenv("OPENAI_API_KEY")
         if api_key:
-            openai_client = OpenAI(api_key=api_key)
+            import httpx
+            import openai
+            limits = httpx.Limits(max_connections=HTTP_MAX_CONNECTIONS, max_keepalive_connections=HTTP_MAX_KEEPALIVE_CONNECTIONS)
+            # The SDK itself retries timeouts, rate limits and 5xx responses with exponential backoff
+            openai_client = openai.OpenAI(
+                api_key=api_key, timeout=REQUEST_TIMEOUT, max_retries=MAX_RETRIES,
+                http_client=openai.DefaultHttpxClient(limits=limits, timeout=REQUEST_TIMEOUT, http2=HTTP2_ENABLED)
+            )
+            openai_async_client = openai.AsyncOpenAI(
+                api_key=api_key, timeout=REQUEST_TIMEOUT, max_retries=MAX_RETRIES,
+                http_client=openai.DefaultAsyncHttpxClient(limits=limits, timeout=REQUEST_TIMEOUT, http2=HTTP2_ENABLED)
+            )
         else:
             raise ValueError("OpenAI API Key not found. Set OPENAI_API_KEY in .env.")
     elif llm_choice == "gemini":
         api_key = os.getenv("GOOGLE_API_KEY")
         if api_key:
+            import google.generativeai as genai
             genai.configure(api_key=api_key)
-            gemini_model = genai.GenerativeModel('gemini-1.5-flash') # Or 'gemini-1.5-pro'
+            gemini_model = genai.GenerativeModel(MODELS["gemini"]["default"])
         else:
             raise ValueError("Google Gemini API Key not found. Set GOOGLE_API_KEY in .env.")
     else:
         raise ValueError(f"Invalid LLM_CHOICE: '{llm_choice}'. Must be 'openai' or 'gemini'.")
+    return openai_client, openai_async_client, gemini_model
+
+
+def _genai():
+    """Returns the google.generativeai module, which keeps the API key set by initialize_llm_clients."""
+    import google.generativeai as genai
+    return genai
+
+
+def _openai_transient_errors() -> tuple:
+    """Returns the OpenAI errors that count towards the circuit breaker (APITimeoutError is an APIConnectionError)."""
+    import openai
+    return (openai.APIConnectionError, openai.RateLimitError, openai.InternalServerError)
+
+
+def _gemini_transient_errors() -> tuple:
+    """Returns the Gemini errors worth retrying, which also count towards the circuit breaker."""
+    from google.api_core import exceptions as api_errors
+    return (TimeoutError, asyncio.TimeoutError, api_errors.DeadlineExceeded, api_errors.ServiceUnavailable,
+            api_errors.ResourceExhausted, api_errors.InternalServerError)
+
+
+class _CircuitBreaker:
+    """
+    Context manager around provider requests that opens after CIRCUIT_FAILURE_THRESHOLD consecutive
+    failures with one of its transient errors. While open, entering it raises immediately; once
+    CIRCUIT_RESET_SECONDS have passed, a trial request goes through and a success closes it again.
+    Thread-safe, since sync requests run on Streamlit threads and async ones on the shared loop.
+    """
+
+    def __init__(self, provider: str, transient_errors):
+        self.provider = provider
+        self.transient_errors = transient_errors # Callable returning the SDK's transient error types
+        self.failures = 0
+        self.opened_at = 0.0
+        self._lock = threading.Lock()
+
+    def __enter__(self):
+        with self._lock:
+            remaining = self.opened_at + CIRCUIT_RESET_SECONDS - time.monotonic()
+            if self.failures >= CIRCUIT_FAILURE_THRESHOLD and remaining > 0:
+                raise RuntimeError(f"{self.provider} is failing repeatedly; skipping requests for the next {remaining:.0f}s.")
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        with self._lock:
+            if exc_type is None:
+                self.failures = 0
+            elif issubclass(exc_type, self.transient_errors()):
+                self.failures += 1
+                if self.failures >= CIRCUIT_FAILURE_THRESHOLD:
+                    self.opened_at = time.monotonic()
+        return False
+
+
+_circuit_breakers = {"openai": _CircuitBreaker("OpenAI", _openai_transient_errors),
+                     "gemini": _CircuitBreaker("Gemini", _gemini_transient_errors)}
+
+
+def is_ready(llm_choice: str) -> bool:
+    """Returns True if the client for llm_choice has been initialized."""
+    return (llm_choice == "openai" and openai_client is not None) or (llm_choice == "gemini" and gemini_model is not None)
+
+
+def _get_event_loop() -> asyncio.AbstractEventLoop:
+    """Returns the shared LLM event loop, starting its background thread on first use."""
+    global _event_loop
+    with _event_loop_lock:
+        if _event_loop is None:
+            _event_loop = asyncio.new_event_loop()
+            threading.Thread(target=_event_loop.run_forever, name="llm-event-loop", daemon=True).start()
+    return _event_loop
+
+
+def _get_request_semaphore() -> asyncio.Semaphore:
+    """Returns the semaphore bounding concurrent async requests; only used on the shared loop."""
+    global _request_semaphore
+    if _request_semaphore is None:
+        _request_semaphore = asyncio.Semaphore(LLM_CONCURRENCY)
+    return _request_semaphore
+
+
+class _TokenBucket:
+    """
+    Async token bucket refilling per_minute units per minute, in bursts of at most per_minute
+    (requests for the RPM cap, LLM tokens for the TPM cap).
+    Only used on the shared LLM event loop, so it needs no lock.
+    """
+
+    def __init__(self, per_minute: int):
+        self.rate = per_minute / 60.0
+        self.capacity = float(per_minute)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    async def acquire(self, amount: float = 1):
+        amount = min(amount, self.capacity) # A request larger than a full bucket waits for a full bucket
+        while True:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens >= amount:
+                self.tokens -= amount
+                return
+            await asyncio.sleep((amount - self.tokens) / self.rate)
 
 
-def _call_llm(messages: list, response_format: str = "text", llm_choice: str = "openai") -> str:
+@contextlib.asynccontextmanager
+async def _request_slot(messages: list, llm_choice: str, max_out: int):
+    """
+    Holds one of the LLM_CONCURRENCY request slots and, when caps are set, one per-minute request
+    and the request's estimated tokens (prompt plus max_out).
+    """
+    global _rate_limiter, _token_limiter
+    async with _get_request_semaphore():
+        if LLM_REQUESTS_PER_MINUTE > 0:
+            if _rate_limiter is None:
+                _rate_limiter = _TokenBucket(LLM_REQUESTS_PER_MINUTE)
+            await _rate_limiter.acquire()
+        if LLM_TOKENS_PER_MINUTE > 0:
+            if _token_limiter is None:
+                _token_limiter = _TokenBucket(LLM_TOKENS_PER_MINUTE)
+            await _token_limiter.acquire(sum(token_utils.count_tokens(msg["content"], llm_choice) for msg in messages) + max_out)
+        yield
+
+
+def submit_async(coro):
+    """
+    Schedules a coroutine on the shared LLM event loop without blocking.
+    Returns:
+        concurrent.futures.Future: Resolves to the coroutine's result.
+    """
+    return asyncio.run_coroutine_threadsafe(coro, _get_event_loop())
+
+
+def run_async(coro):
+    """Runs a coroutine on the shared LLM event loop and blocks until it completes."""
+    return submit_async(coro).result()
+
+
+def iterate_async(async_iterator):
+    """
+    Drives an async iterator on the shared LLM event loop from synchronous code,
+    yielding its items as they arrive (e.g. to feed st.write_stream).
+    """
+    loop = _get_event_loop()
+    try:
+        while True:
+            try:
+                yield asyncio.run_coroutine_threadsafe(async_iterator.__anext__(), loop).result()
+            except StopAsyncIteration:
+                return
+    finally:
+        asyncio.run_coroutine_threadsafe(async_iterator.aclose(), loop).result()
+
+
+def _embed_text(text: str, llm_choice: str = "openai") -> list:
+    """
+    Returns an embedding vector for text using the chosen provider.
+    Used by the semantic tier of the response cache.
+    """
+    if llm_choice == "openai":
+        response = openai_client.embeddings.create(model="text-embedding-3-small", input=text)
+        return response.data[0].embedding
+    elif llm_choice == "gemini":
+        return _genai().embed_content(model="models/text-embedding-004", content=text)["embedding"]
+    raise ValueError(f"LLM choice '{llm_choice}' is not supported.")
+
+
+def _openai_response_format(response_format: str, response_schema: dict):
+    """Returns the OpenAI response_format: a strict JSON Schema when one is given, else JSON mode or plain text."""
+    if response_format != "json_object":
+        return None
+    if response_schema:
+        return {"type": "json_schema", "json_schema": {"name": "response", "schema": response_schema, "strict": True}}
+    return {"type": "json_object"}
+
+
+def _gemini_schema(schema: dict) -> dict:
+    """
+    Converts a JSON Schema into the OpenAPI subset Gemini accepts: upper-case type names
+    and no additionalProperties (strict mode is implied by the schema itself).
+    """
+    converted = {}
+    for key, value in schema.items():
+        if key == "type":
+            converted[key] = value.upper()
+        elif key == "properties":
+            converted[key] = {name: _gemini_schema(prop) for name, prop in value.items()}
+        elif key == "items":
+            converted[key] = _gemini_schema(value)
+        elif key != "additionalProperties":
+            converted[key] = value
+    return converted
+
+
+def _openai_request(messages: list, response_format: str, prompt_cache_key: str, max_out: int, response_schema: dict = None,
+                    model: str = None) -> dict:
+    """Builds the keyword arguments for an OpenAI chat completion request."""
+    return dict(
+        model=model or MODELS["openai"]["default"],
+        messages=messages,
+        response_format=_openai_response_format(response_format, response_schema),
+        temperature=JSON_TEMPERATURE if response_format == "json_object" else TEXT_TEMPERATURE,
+        max_tokens=max_out, # Bounds generation time, which grows with output length
+        # Routes requests sharing a static prompt prefix to the same prompt cache
+        extra_body={"prompt_cache_key": prompt_cache_key} if prompt_cache_key else None
+    )
+
+
+def _gemini_request(messages: list, response_format: str, max_out: int, response_schema: dict = None) -> tuple:
+    """Converts chat messages into a Gemini system instruction, contents and a matching generation config."""
+    # System text goes to the model's native system_instruction channel; the user text is a single user turn
+    system_instruction = "\n\n".join(msg["content"] for msg in messages if msg["role"] == "system") or None
+    user_content = "".join(msg["content"] for msg in messages if msg["role"] == "user")
+    gemini_messages = [{"role": "user", "parts": [{"text": user_content}]}]
+
+    genai = _genai()
+    generation_config = genai.types.GenerationConfig(
+        response_mime_type="application/json",
+        response_schema=_gemini_schema(response_schema) if response_schema else None,
+        temperature=JSON_TEMPERATURE,
+        max_output_tokens=max_out
+    ) if response_format == "json_object" else genai.types.GenerationConfig(temperature=TEXT_TEMPERATURE, max_output_tokens=max_out)
+    return system_instruction, gemini_messages, generation_config
+
+
+def _retry_delay(attempt: int) -> float:
+    """Returns the backoff before retry number attempt + 1, with jitter so concurrent retries spread out."""
+    return RETRY_BACKOFF_SECONDS * 2 ** attempt * random.uniform(0.5, 1.5)
+
+
+def _get_gemini_model(model: str = None, system_instruction: str = None):
+    """
+    Returns the Gemini model object for a model name and system instruction; the initialized
+    gemini_model serves the default model without one.
+    """
+    model = model or MODELS["gemini"]["default"]
+    if model == MODELS["gemini"]["default"] and not system_instruction:
+        return gemini_model
+    key = (model, system_instruction)
+    if key not in _gemini_models:
+        _gemini_models[key] = _genai().GenerativeModel(model, system_instruction=system_instruction)
+    return _gemini_models[key]
+
+
+def _gemini_generate(gemini_messages: list, generation_config, model: str = None, system_instruction: str = None):
+    """Calls Gemini with a per-request timeout, retrying timeouts and transient errors with exponential backoff."""
+    for attempt in range(MAX_RETRIES + 1):
+        try:
+            return _get_gemini_model(model, system_instruction).generate_content(gemini_messages, generation_config=generation_config,
+                                                                                 request_options={"timeout": REQUEST_TIMEOUT})
+        except _gemini_transient_errors() as e:
+            if attempt == MAX_RETRIES:
+                raise
+            delay = _retry_delay(attempt)
+            print(f"Gemini request failed ({e!r}); retrying in {delay:.1f}s.")
+            time.sleep(delay)
+
+
+async def _gemini_generate_async(gemini_messages: list, generation_config, stream: bool = False, model: str = None,
+                                 system_instruction: str = None):
+    """
+    Async counterpart of _gemini_generate. For streamed responses the timeout and retries
+    cover starting the stream, not reading it.
+    """
+    for attempt in range(MAX_RETRIES + 1):
+        try:
+            return await asyncio.wait_for(
+                _get_gemini_model(model, system_instruction).generate_content_async(gemini_messages, generation_config=generation_config,
+                                                                                    stream=stream),
+                REQUEST_TIMEOUT
+            )
+        except _gemini_transient_errors() as e:
+            if attempt == MAX_RETRIES:
+                raise
+            delay = _retry_delay(attempt)
+            print(f"Gemini request failed ({e!r}); retrying in {delay:.1f}s.")
+            await asyncio.sleep(delay)
+
+
+def _checked_json(content: str, truncated: bool) -> str:
+    """
+    Returns a JSON-format response, raising instead if it was cut off at max_out or does not parse,
+    so that a broken response is reported as an error and never reaches the response cache.
+    """
+    if truncated:
+        raise ValueError("The JSON response was cut off at the output token limit.")
+    json_utils.loads(content) # JSONDecodeError is a ValueError
+    return content
+
+
+def _gemini_truncated(response) -> bool:
+    """Returns True if Gemini stopped generating because it reached max_output_tokens."""
+    finish_reason = response.candidates[0].finish_reason if response.candidates else None
+    return getattr(finish_reason, "name", finish_reason) == "MAX_TOKENS"
+
+
+@llm_cache.cached_llm_call(embed_fn=_embed_text)
+def _complete(messages: list, response_format: str = "text", llm_choice: str = "openai", prompt_cache_key: str = None,
+              max_out: int = DEFAULT_MAX_OUTPUT_TOKENS, response_schema: dict = None, model: str = None) -> str:
+    """
+    Sends messages to the chosen LLM and returns the response content.
+    Raises on any provider error so that failures never reach the response cache.
+    """
+    if llm_choice == "openai":
+        if not openai_client:
+            raise ValueError("OpenAI client not initialized. Call initialize_llm_clients first.")
+        with _circuit_breakers["openai"]:
+            response = openai_client.chat.completions.create(**_openai_request(messages, response_format, prompt_cache_key, max_out, response_schema, model))
+        if response_format == "json_object":
+            return _checked_json(response.choices[0].message.content, response.choices[0].finish_reason == "length")
+        return response.choices[0].message.content
+    elif llm_choice == "gemini":
+        if not gemini_model:
+            raise ValueError("Gemini model not initialized. Call initialize_llm_clients first.")
+        system_instruction, gemini_messages, generation_config = _gemini_request(messages, response_format, max_out, response_schema)
+        with _circuit_breakers["gemini"]:
+            response = _gemini_generate(gemini_messages, generation_config, model, system_instruction)
+        if response_format == "json_object":
+            return _checked_json(response.text, _gemini_truncated(response))
+        return response.text
+    else:
+        raise ValueError(f"LLM choice '{llm_choice}' is not supported.")
+
+
+@llm_cache.cached_llm_call(embed_fn=_embed_text)
+async def _complete_async(messages: list, response_format: str = "text", llm_choice: str = "openai", prompt_cache_key: str = None,
+                          max_out: int = DEFAULT_MAX_OUTPUT_TOKENS, response_schema: dict = None, model: str = None) -> str:
+    """Async counterpart of _complete; shares its response cache entries."""
+    if llm_choice == "openai":
+        if not openai_async_client:
+            raise ValueError("OpenAI client not initialized. Call initialize_llm_clients first.")
+        async with _request_slot(messages, llm_choice, max_out):
+            with _circuit_breakers["openai"]:
+                response = await openai_async_client.chat.completions.create(**_openai_request(messages, response_format, prompt_cache_key, max_out, response_schema, model))
+        if response_format == "json_object":
+            return _checked_json(response.choices[0].message.content, response.choices[0].finish_reason == "length")
+        return response.choices[0].message.content
+    elif llm_choice == "gemini":
+        if not gemini_model:
+            raise ValueError("Gemini model not initialized. Call initialize_llm_clients first.")
+        system_instruction, gemini_messages, generation_config = _gemini_request(messages, response_format, max_out, response_schema)
+        async with _request_slot(messages, llm_choice, max_out):
+            with _circuit_breakers["gemini"]:
+                response = await _gemini_generate_async(gemini_messages, generation_config, model=model, system_instruction=system_instruction)
+        if response_format == "json_object":
+            return _checked_json(response.text, _gemini_truncated(response))
+        return response.text
+    else:
+        raise ValueError(f"LLM choice '{llm_choice}' is not supported.")
+
+
+@llm_cache.cached_llm_stream
+async def _stream_async(messages: list, response_format: str = "text", llm_choice: str = "openai", prompt_cache_key: str = None,
+                        max_out: int = DEFAULT_MAX_OUTPUT_TOKENS, response_schema: dict = None, model: str = None):
+    """Streaming counterpart of _complete_async; yields response text chunks as they are generated."""
+    if llm_choice == "openai":
+        if not openai_async_client:
+            raise ValueError("OpenAI client not initialized. Call initialize_llm_clients first.")
+        # The slot is held until the stream is fully received
+        async with _request_slot(messages, llm_choice, max_out):
+            with _circuit_breakers["openai"]:
+                stream = await openai_async_client.chat.completions.create(
+                    **_openai_request(messages, response_format, prompt_cache_key, max_out, response_schema, model), stream=True
+                )
+                async for chunk in stream:
+                    if chunk.choices and chunk.choices[0].delta.content:
+                        yield chunk.choices[0].delta.content
+    elif llm_choice == "gemini":
+        if not gemini_model:
+            raise ValueError("Gemini model not initialized. Call initialize_llm_clients first.")
+        system_instruction, gemini_messages, generation_config = _gemini_request(messages, response_format, max_out, response_schema)
+        async with _request_slot(messages, llm_choice, max_out):
+            with _circuit_breakers["gemini"]:
+                response = await _gemini_generate_async(gemini_messages, generation_config, stream=True, model=model,
+                                                        system_instruction=system_instruction)
+                async for chunk in response:
+                    yield chunk.text
+    else:
+        raise ValueError(f"LLM choice '{llm_choice}' is not supported.")
+
+
+def _resolve_model(llm_choice: str, model_tier: str):
+    """Returns the model name for a provider and tier, or None for an unsupported provider (rejected later)."""
+    return MODELS[llm_choice][model_tier] if llm_choice in MODELS else None
+
+
+def _call_llm(messages: list, response_format: str = "text", llm_choice: str = "openai", prompt_cache_key: str = None,
+              max_out: int = DEFAULT_MAX_OUTPUT_TOKENS, refresh: bool = False,
+              response_schema: dict = None, model_tier: str = "default") -> str:
     """
     Internal helper to call the chosen LLM (OpenAI or Gemini).
+    Identical requests are served from the response cache (see agents/llm_cache.py).
     Args:
         messages (list): A list of message dictionaries for the chat completion.
         response_format (str): "text" for plain text, "json_object" for JSON output.
         llm_choice (str): "openai" or "gemini".
+        prompt_cache_key (str): Optional OpenAI prompt-cache key for prompts with a static prefix.
+            Bump its version suffix whenever the static part of the prompt changes.
+        max_out (int): Maximum number of output tokens to generate.
+        refresh (bool): Bypass the response cache and request a fresh completion.
+        response_schema (dict): Optional JSON Schema for "json_object" responses. The provider then
+            constrains its output to the schema (OpenAI structured outputs / Gemini response_schema).
+        model_tier (str): "default", or "light" for the provider's smaller, faster model (see MODELS).
     Returns:
-        str: The content from the LLM response.
-    Raises:
-        ValueError: If the LLM choice is not supported or client is not initialized.
+        str: The content from the LLM response, or an error message/JSON error object on failure.
     """
     try:
-        if llm_choice == "openai":
-            if not openai_client:
-                raise ValueError("OpenAI client not initialized. Call initialize_llm_clients first.")
-            response = openai_client.chat.completions.create(
-                model="gpt-4o", # Using gpt-4o for better quality. Can use "gpt-3.5-turbo" for faster, cheaper, but less capable results
-                messages=messages,
-                response_format={"type": "json_object"} if response_format == "json_object" else None,
-                temperature=0.4 # Lower temperature for more factual/less creative output
-            )
-            return response.choices[0].message.content
-        elif llm_choice == "gemini":
-            if not gemini_model:
-                raise ValueError("Gemini model not initialized. Call initialize_llm_clients first.")
-
-            gemini_messages = []
-            user_content = ""
-            for msg in messages:
-                if msg["role"] == "system":
-                    user_content += msg["content"] + "\n\n"
-                elif msg["role"] == "user":
-                    user_content += msg["content"]
-
-            gemini_messages.append({"role": "user", "parts": [{"text": user_content}]})
-
-            generation_config = genai.types.GenerationConfig(
-                response_mime_type="application/json",
-                temperature=0.4
-            ) if response_format == "json_object" else genai.types.GenerationConfig(temperature=0.4)
-
-            response = gemini_model.generate_content(
-                gemini_messages,
-                generation_config=generation_config
-            )
-            return response.text
-        else:
-            raise ValueError(f"LLM choice '{llm_choice}' is not supported.")
+        return _complete(messages, response_format=response_format, llm_choice=llm_choice,
+                         prompt_cache_key=prompt_cache_key, max_out=max_out, response_schema=response_schema,
+                         model=_resolve_model(llm_choice, model_tier), refresh_cache=refresh)
+    except Exception as e:
+        print(f"Error calling LLM ({llm_choice}): {e}")
+        return json_utils.dumps({"error": str(e)}) if response_format == "json_object" else f"Error: {e}"
+
+
+async def _call_llm_async(messages: list, response_format: str = "text", llm_choice: str = "openai", prompt_cache_key: str = None,
+                          max_out: int = DEFAULT_MAX_OUTPUT_TOKENS, refresh: bool = False,
+                          response_schema: dict = None, model_tier: str = "default") -> str:
+    """
+    Async counterpart of _call_llm, for running several LLM calls concurrently.
+    Schedule it on the shared LLM event loop via run_async/submit_async.
+    """
+    try:
+        return await _complete_async(messages, response_format=response_format, llm_choice=llm_choice,
+                                     prompt_cache_key=prompt_cache_key, max_out=max_out, response_schema=response_schema,
+                                     model=_resolve_model(llm_choice, model_tier), refresh_cache=refresh)
     except Exception as e:
         print(f"Error calling LLM ({llm_choice}): {e}")
-        return json.dumps({"error": str(e)}) if response_format == "json_object" else f"Error: {e}"
\ No newline at end of file
+        return json_utils.dumps({"error": str(e)}) if response_format == "json_object" else f"Error: {e}"
+
+
+async def _call_llm_stream_async(messages: list, response_format: str = "text", llm_choice: str = "openai", prompt_cache_key: str = None,
+                                 max_out: int = DEFAULT_MAX_OUTPUT_TOKENS, refresh: bool = False, model_tier: str = "default"):
+    """
+    Streaming variant of _call_llm_async for text responses. Yields chunks as they arrive;
+    on failure, yields an error message instead of raising.
+    """
+    try:
+        async for chunk in _stream_async(messages, response_format=response_format, llm_choice=llm_choice,
+                                         prompt_cache_key=prompt_cache_key, max_out=max_out,
+                                         model=_resolve_model(llm_choice, model_tier), refresh_cache=refresh):
+            yield chunk
+    except Exception as e:
+        print(f"Error calling LLM ({llm_choice}): {e}")
+        yield f"Error: {e}"
+
+
+def _call_llm_stream(messages: list, response_format: str = "text", llm_choice: str = "openai", prompt_cache_key: str = None,
+                     max_out: int = DEFAULT_MAX_OUTPUT_TOKENS, refresh: bool = False, model_tier: str = "default"):
+    """
+    Synchronous generator over _call_llm_stream_async, suitable for st.write_stream.
+    JSON responses should use _call_llm, since they are only usable once complete.
+    """
+    yield from iterate_async(_call_llm_stream_async(messages, response_format=response_format, llm_choice=llm_choice,
+                                                    prompt_cache_key=prompt_cache_key, max_out=max_out, refresh=refresh,
+                                                    model_tier=model_tier))
+
+
+def build_messages(system_instruction: str, template, slots: dict) -> list:
+    """
+    Renders a prompt template into the chat messages shared by every agent.
+    Args:
+        system_instruction (str): The system message.
+        template (string.Template): The user prompt template, compiled once at import by the agent module,
+            so each request only substitutes the slots.
+        slots (dict): Values substituted into the template.
+    Returns:
+        list: The system and user message dictionaries.
+    """
+    return [
+        {"role": "system", "content": system_instruction},
+        {"role": "user", "content": template.substitute(slots)}
+    ]
+
+
+def run_prompt(system_instruction: str, template, slots: dict, **options) -> str:
+    """
+    Renders an agent prompt and sends it through _call_llm.
+    Args:
+        options: Keyword arguments for _call_llm (response_format, llm_choice, prompt_cache_key, max_out, refresh,
+            response_schema, model_tier).
+    """
+    return _call_llm(build_messages(system_instruction, template, slots), **options)
+
+
+async def run_prompt_async(system_instruction: str, template, slots: dict, **options) -> str:
+    """Async counterpart of run_prompt, sent through _call_llm_async."""
+    return await _call_llm_async(build_messages(system_instruction, template, slots), **options)
+
+
+def run_prompt_stream(system_instruction: str, template, slots: dict, **options):
+    """Streaming counterpart of run_prompt, yielding chunks from _call_llm_stream."""
+    yield from _call_llm_stream(build_messages(system_instruction, template, slots), **options)
@@ -1,8 +1,85 @@
 # --- agents/proposal_generation_agent.py ---
 # Agent responsible for generating a draft technical proposal based on structured SOW data.
 
-import json
-from agents.llm_connector import _call_llm # Import the shared LLM caller
+import itertools
+import string
+
+from agents import json_utils
+from agents.llm_connector import run_prompt, run_prompt_async, run_prompt_stream # Import the shared prompt runners
+
+_INVALID_DATA_MESSAGE = "Cannot draft proposal: Invalid or missing SOW structured data."
+MAX_OUTPUT_TOKENS = 4000 # Eight written sections; lower caps cut off the closing sections
+# The extracted details above already carry every field, so echoing the raw JSON only doubles
+# input tokens. Enable to append it anyway as a trailing appendix.
+INCLUDE_RAW_SOW_JSON = False
+
+_SYSTEM_INSTRUCTION = "You are a senior solution architect and expert technical proposal writer. Your task is to generate a comprehensive, persuasive, and professional technical proposal draft in Markdown format. The proposal must directly address the client's Scope of Work details and clearly outline our proposed solution."
+# The section scaffold is static and comes first so providers can reuse it as a cached
+# prompt prefix; everything specific to this SOW is appended at the end.
+# The title and sections 4-6 only restate the extracted lists, so they are rendered from the
+# SOW data (_FIXED_SECTIONS_TEMPLATE) instead of being generated as output tokens.
+_PROMPT_TEMPLATE = string.Template("""
+    Draft a comprehensive technical proposal based on the extracted Scope of Work (SOW) details provided at the end of this message.
+    Use professional, persuasive language and standard Markdown formatting for readability.
+    Ensure the proposal directly addresses the client's needs and clearly outlines our proposed solution.
+    Do not write a title. Start directly with "## 1. Executive Summary" and follow this structure. Sections 4 to 6
+    (Scope of Work, Out of Scope, Key Deliverables) are inserted from the SOW details automatically, so go straight
+    from section 3 to section 7 and do not write them:
+
+    ## 1. Executive Summary
+    Provide a concise, high-level overview of the client's challenge, our understanding of the project's objectives, and how our solution will deliver value. Emphasize key benefits and our unique capabilities. This section should compel the reader to continue.
+
+    ## 2. Understanding the Client's Needs & Objectives
+    Demonstrate a clear and empathetic understanding of the client's current situation, their stated and implied pain points, and the specific problems or opportunities the project aims to address. Clearly articulate how our understanding aligns with their vision.
+    Include a **Key Objectives:** list based on the Key Objectives in the SOW details.
+
+    ## 3. Proposed Solution & Approach
+    Detail our recommended technical solution, outlining its core components and how it directly addresses the client's objectives and technical requirements. Describe the strategic approach and methodology (e.g., Agile, phased implementation, iterative development) we will employ to achieve project success.
+    Address the Technical Requirements from the SOW details by explaining how our solution incorporates or leverages them.
+
+    ## 7. Technical Architecture & Stack
+    Propose a high-level technical architecture diagram (described in text) and specify the primary technologies, platforms, and tools that will be utilized. Explain how this stack aligns with the SOW's technical requirements, ensures scalability, security, and performance.
+
+    ## 8. Project Timeline & Phases
+    Provide a high-level proposed timeline with key phases and milestones, based on the Timeline Overview in the SOW details. Describe the duration of each phase and what will be achieved.
+
+    ## 9. Project Team & Governance
+    Outline the proposed team structure, key roles (e.g., Project Manager, Lead Developer, QA), and how the project will be managed and governed. Describe communication protocols and reporting mechanisms to ensure successful delivery and effective collaboration with the Stakeholders in the SOW details.
+
+    ## 10. Assumptions and Constraints
+    List any critical assumptions made in preparing this proposal (e.g., client data availability, access to systems) and reiterate the Key Constraints from the SOW details (e.g., budget limits, specific regulatory requirements) that will influence project execution.
+
+    ## 11. Next Steps
+    Outline the proposed next steps to move forward with the client and initiate the project. This should include any necessary meetings, approvals, or detailed planning sessions.
+
+    ---
+    Extracted SOW Details:
+    Project Name: $projectName
+    Client Name: $clientName
+    Key Objectives: $objectives
+    Technical Requirements: $technicalRequirements_str
+    Included Scope: $scopeOfWork
+    Out of Scope: $outOfScope
+    Key Deliverables: $deliverables
+    Timeline Overview: $timelineOverview_str
+    Stakeholders: $stakeholders_str
+    Key Constraints: $keyConstraints
+    $rawSowAppendix---
+    """)
+
+# Rendered in Python and inserted before the LLM's section 7
+_FIXED_SECTIONS_TEMPLATE = string.Template("""## 4. Scope of Work (Our Understanding)
+$scopeOfWork
+
+## 5. Out of Scope
+$outOfScope
+
+## 6. Key Deliverables
+$deliverables
+
+""")
+_RESUME_HEADING = "## 7."
+
 
 # Helper to format lists for prompts, with a default message if list is empty
 def _format_list_for_prompt(items: list, default_message: str) -> str:
@@ -12,13 +89,8 @@ def _format_list_for_prompt(items: list, default_message: str) -> str:
     return "\n- " + "\n- ".join(items)
 
 
-def proposal_generation_agent_run(sow_structured_data: dict, llm_choice: str = "openai") -> str:
-    """
-    Agent responsible for generating a draft technical proposal based on structured SOW data.
-    """
-    if not sow_structured_data or sow_structured_data.get("error"):
-        return "Cannot draft proposal: Invalid or missing SOW structured data."
-
+def _build_slots(sow_structured_data: dict) -> dict:
+    """Builds the template slot values for the proposal prompt."""
     # Extracting data with fallbacks for cleaner prompt formatting
     projectName = sow_structured_data.get("project_name", "the Project")
     clientName = sow_structured_data.get("client_name", "the Client")
@@ -26,14 +98,13 @@ def proposal_generation_agent_run(sow_structured_data: dict, llm_choice: str = "
     scopeOfWork = _format_list_for_prompt(sow_structured_data.get("scope_of_work"), "Detailed scope will be outlined upon further analysis.")
     outOfScope = _format_list_for_prompt(sow_structured_data.get("out_of_scope"), "Any items not explicitly included in the 'Scope of Work' are considered out of scope.")
     
-    deliverablesBuilder = []
-    if sow_structured_data.get("deliverables"):
-        for d in sow_structured_data["deliverables"]:
-            if isinstance(d, dict) and "name" in d and "description" in d:
-                deliverablesBuilder.append(f"- **{d['name']}**: {d['description']}")
-            elif isinstance(d, str): # Fallback for string deliverables
-                deliverablesBuilder.append(f"- **{d}**: Not detailed by AI")
-    deliverables = "\n" + "\n".join(deliverablesBuilder) if deliverablesBuilder else "- Specific deliverables to be detailed."
+    deliverables = "\n".join(
+        f"- **{d['name']}**: {d['description']}" if isinstance(d, dict)
+        else f"- **{d}**: Not detailed by AI" # Fallback for string deliverables
+        for d in sow_structured_data.get("deliverables") or ()
+        if isinstance(d, str) or (isinstance(d, dict) and "name" in d and "description" in d)
+    )
+    deliverables = "\n" + deliverables if deliverables else "- Specific deliverables to be detailed."
 
 
     technicalRequirements = sow_structured_data.get("technical_requirements")
@@ -47,62 +118,104 @@ def proposal_generation_agent_run(sow_structured_data: dict, llm_choice: str = "
     timelineOverview_str = " ".join(timelineOverview) if timelineOverview else "A detailed project timeline will be developed in collaboration with the client."
 
 
-    system_instruction = "You are a senior solution architect and expert technical proposal writer. Your task is to generate a comprehensive, persuasive, and professional technical proposal draft in Markdown format. The proposal must directly address the client's Scope of Work details and clearly outline our proposed solution."
-    user_prompt = f"""
-    Based on the following extracted Scope of Work (SOW) details for "{projectName}" by "{clientName}",
-    draft a comprehensive technical proposal. Use professional, persuasive language and standard Markdown formatting for readability.
-    Ensure the proposal directly addresses the client's needs and clearly outlines our proposed solution.
-
-    ---
-    Extracted SOW Details:
-    {json.dumps(sow_structured_data, indent=2)}
-    ---
-
-    # Technical Proposal for {projectName}
-
-    ## 1. Executive Summary
-    Provide a concise, high-level overview of {clientName}'s challenge, our understanding of {projectName}'s objectives, and how our solution will deliver value. Emphasize key benefits and our unique capabilities. This section should compel the reader to continue.
-
-    ## 2. Understanding the Client's Needs & Objectives
-    Demonstrate a clear and empathetic understanding of {clientName}'s current situation, their stated and implied pain points, and the specific problems or opportunities {projectName} aims to address. Clearly articulate how our understanding aligns with their vision.
-    **Key Objectives:**
-    {objectives}
-
-    ## 3. Proposed Solution & Approach
-    Detail our recommended technical solution, outlining its core components and how it directly addresses the client's objectives and technical requirements. Describe the strategic approach and methodology (e.g., Agile, phased implementation, iterative development) we will employ to achieve project success.
-    Address the technical requirements mentioned ({technicalRequirements_str}) by explaining how our solution incorporates or leverages them.
+    return dict(
+        projectName=projectName,
+        clientName=clientName,
+        objectives=objectives,
+        technicalRequirements_str=technicalRequirements_str,
+        scopeOfWork=scopeOfWork,
+        outOfScope=outOfScope,
+        deliverables=deliverables,
+        timelineOverview_str=timelineOverview_str,
+        stakeholders_str=stakeholders_str,
+        keyConstraints=keyConstraints,
+        rawSowAppendix=f"\n    Full Structured SOW Data:\n    {json_utils.dumps(sow_structured_data)}\n    " if INCLUDE_RAW_SOW_JSON else ""
+    )
 
-    ## 4. Scope of Work (Our Understanding)
-    Clearly define the activities, tasks, and responsibilities that are **included** in our proposed solution. This should align precisely with the SOW, ensuring no ambiguity.
-    {scopeOfWork}
 
-    ## 5. Out of Scope
-    Clearly define what is **not included** in this proposal to manage expectations, prevent scope creep, and avoid misunderstandings.
-    {outOfScope}
+def _assemble_proposal(chunks, slots: dict):
+    """
+    Yields the proposal title, then the LLM's sections with the fixed sections 4-6 inserted before
+    section 7 (or appended, if the LLM left section 7 out). Error messages pass through unchanged;
+    after an error chunk mid-stream, nothing else (in particular no fixed sections) is added.
+    Args:
+        chunks: The LLM's Markdown, as one string in a list or as streamed chunks.
+        slots (dict): The prompt slots from _build_slots.
+    """
+    chunks = iter(chunks)
+    first = next(chunks, "")
+    if first.startswith("Error:"):
+        yield first
+        yield from chunks
+        return
+
+    project_name = slots["projectName"] if slots["projectName"] != "N/A" else "the Project"
+    yield f"# Technical Proposal for {project_name}\n\n"
+    fixed_sections = _FIXED_SECTIONS_TEMPLATE.substitute(slots)
+    # Hold back a heading-sized tail of the stream, in case "## 7." is split across chunks
+    keep = len(_RESUME_HEADING) - 1
+    pending, inserted = "", False
+    for chunk in itertools.chain([first], chunks):
+        if chunk.startswith("Error:"): # The stream failed part-way; the draft is incomplete
+            yield pending + "\n\n"
+            yield chunk
+            return
+        if inserted:
+            yield chunk
+            continue
+        pending += chunk
+        index = pending.find(_RESUME_HEADING)
+        if index >= 0:
+            yield pending[:index] + fixed_sections + pending[index:]
+            pending, inserted = "", True
+        elif len(pending) > keep:
+            yield pending[:-keep]
+            pending = pending[-keep:]
+    if not inserted:
+        yield pending.rstrip() + "\n\n" + fixed_sections
+
+
+def _finish_proposal(response_content: str, sow_structured_data: dict) -> str:
+    """Adds the title and the fixed sections 4-6 to a complete LLM response (e.g. from a batch job)."""
+    return "".join(_assemble_proposal([response_content], _build_slots(sow_structured_data)))
+
+
+def proposal_generation_agent_run(sow_structured_data: dict, llm_choice: str = "openai", refresh: bool = False) -> str:
+    """
+    Agent responsible for generating a draft technical proposal based on structured SOW data.
+    Set refresh=True to bypass the response cache and draft a new variant.
+    """
+    if not sow_structured_data or sow_structured_data.get("error"):
+        return _INVALID_DATA_MESSAGE
 
-    ## 6. Key Deliverables
-    List the tangible outputs and results that will be provided at various stages of the project. For each deliverable, briefly describe its purpose or content.
-    {deliverables}
+    slots = _build_slots(sow_structured_data)
+    response_content = run_prompt(_SYSTEM_INSTRUCTION, _PROMPT_TEMPLATE, slots,
+                                  response_format="text", llm_choice=llm_choice, prompt_cache_key="sow_proposal_v2", max_out=MAX_OUTPUT_TOKENS, refresh=refresh)
+    return "".join(_assemble_proposal([response_content], slots))
 
-    ## 7. Technical Architecture & Stack
-    Propose a high-level technical architecture diagram (described in text) and specify the primary technologies, platforms, and tools that will be utilized. Explain how this stack aligns with the SOW's technical requirements, ensures scalability, security, and performance.
 
-    ## 8. Project Timeline & Phases
-    Provide a high-level proposed timeline with key phases and milestones. Describe the duration of each phase and what will be achieved.
-    {timelineOverview_str}
+async def proposal_generation_agent_run_async(sow_structured_data: dict, llm_choice: str = "openai", refresh: bool = False) -> str:
+    """
+    Async variant of proposal_generation_agent_run, so the proposal can be drafted concurrently with the summary.
+    """
+    if not sow_structured_data or sow_structured_data.get("error"):
+        return _INVALID_DATA_MESSAGE
 
-    ## 9. Project Team & Governance
-    Outline the proposed team structure, key roles (e.g., Project Manager, Lead Developer, QA), and how the project will be managed and governed. Describe communication protocols and reporting mechanisms to ensure successful delivery and effective collaboration with {stakeholders_str}.
+    slots = _build_slots(sow_structured_data)
+    response_content = await run_prompt_async(_SYSTEM_INSTRUCTION, _PROMPT_TEMPLATE, slots,
+                                              response_format="text", llm_choice=llm_choice, prompt_cache_key="sow_proposal_v2", max_out=MAX_OUTPUT_TOKENS, refresh=refresh)
+    return "".join(_assemble_proposal([response_content], slots))
 
-    ## 10. Assumptions and Constraints
-    List any critical assumptions made in preparing this proposal (e.g., client data availability, access to systems) and reiterate key constraints from the SOW (e.g., budget limits, specific regulatory requirements) that will influence project execution.
 
-    ## 11. Next Steps
-    Outline the proposed next steps to move forward with {clientName} and initiate {projectName}. This should include any necessary meetings, approvals, or detailed planning sessions.
+def proposal_generation_agent_stream(sow_structured_data: dict, llm_choice: str = "openai", refresh: bool = False):
+    """
+    Streaming variant of proposal_generation_agent_run; yields the proposal in chunks as it is generated.
     """
-    messages = [
-        {"role": "system", "content": system_instruction},
-        {"role": "user", "content": user_prompt}
-    ]
+    if not sow_structured_data or sow_structured_data.get("error"):
+        yield _INVALID_DATA_MESSAGE
+        return
 
-    return _call_llm(messages, response_format="text", llm_choice=llm_choice)
\ No newline at end of file
+    slots = _build_slots(sow_structured_data)
+    yield from _assemble_proposal(run_prompt_stream(_SYSTEM_INSTRUCTION, _PROMPT_TEMPLATE, slots,
+                                                    response_format="text", llm_choice=llm_choice, prompt_cache_key="sow_proposal_v2", max_out=MAX_OUTPUT_TOKENS, refresh=refresh),
+                                  slots)
@@ -0,0 +1,113 @@
+# --- agents/token_utils.py ---
+# Token counting, token-aware truncation and chunking for prompt inputs. Uses tiktoken when it is
+# installed and falls back to a ~4 characters-per-token estimate otherwise.
+
+import re
+
+try:
+    import tiktoken
+except ImportError:  # tiktoken is optional; the character heuristic is used instead
+    tiktoken = None
+
+# Rough average for English prose; used for Gemini and when tiktoken is unavailable
+CHARS_PER_TOKEN = 4
+
+_encoding = None
+
+# Zero-width split point before a numbered heading line ("3. Scope", "4.2 Deliverables", "IV. Timeline"),
+# so chunks still concatenate back to the original text
+_SECTION_BREAK = re.compile(r"(?m)^(?=[ \t]*(?:\d+(?:\.\d+)*\.?|[IVX]+\.)[ \t]+[A-Z])")
+_SENTENCE_BREAK = re.compile(r"(?<=[.!?\n])")
+
+
+def _get_encoding():
+    """Returns the gpt-4o tokenizer, loading it on first use."""
+    global _encoding
+    if _encoding is None:
+        _encoding = tiktoken.encoding_for_model("gpt-4o")
+    return _encoding
+
+
+def truncate_to_tokens(text: str, max_tokens: int, llm_choice: str = "openai") -> str:
+    """
+    Truncates text to at most max_tokens tokens.
+    Args:
+        text (str): The text to truncate.
+        max_tokens (int): The token budget.
+        llm_choice (str): "openai" uses the exact tokenizer; other providers use the estimate.
+    Returns:
+        str: The original text if it fits, otherwise its longest prefix within the budget.
+    """
+    if llm_choice != "openai" or tiktoken is None:
+        return text[:max_tokens * CHARS_PER_TOKEN]
+    # Every token is at least one character, so short texts need no encoding at all
+    if len(text) <= max_tokens:
+        return text
+    encoding = _get_encoding()
+    tokens = encoding.encode(text)
+    if len(tokens) <= max_tokens:
+        return text
+    return encoding.decode(tokens[:max_tokens])
+
+
+def count_tokens(text: str, llm_choice: str = "openai") -> int:
+    """Returns the number of tokens in text (exact for OpenAI with tiktoken, estimated otherwise)."""
+    if llm_choice != "openai" or tiktoken is None:
+        return -(-len(text) // CHARS_PER_TOKEN) # Ceiling division
+    return len(_get_encoding().encode(text))
+
+
+def _split_oversized(piece: str, max_tokens: int, llm_choice: str) -> list:
+    """Hard-splits a single sentence that exceeds the budget on its own."""
+    if llm_choice != "openai" or tiktoken is None:
+        step = max_tokens * CHARS_PER_TOKEN
+        return [piece[i:i + step] for i in range(0, len(piece), step)]
+    encoding = _get_encoding()
+    tokens = encoding.encode(piece)
+    return [encoding.decode(tokens[i:i + max_tokens]) for i in range(0, len(tokens), max_tokens)]
+
+
+def _pack(pieces: list, max_tokens: int, llm_choice: str, split_oversized) -> list:
+    """Greedily packs consecutive pieces into chunks of at most max_tokens, splitting oversized pieces with split_oversized."""
+    chunks, current, current_tokens = [], [], 0
+    for piece in pieces:
+        if not piece: # e.g. before a heading on the first line
+            continue
+        piece_tokens = count_tokens(piece, llm_choice)
+        if current and current_tokens + piece_tokens > max_tokens:
+            chunks.append("".join(current))
+            current, current_tokens = [], 0
+        if piece_tokens > max_tokens:
+            # The last sub-chunk stays open so that the following pieces can still join it
+            *closed, piece = split_oversized(piece, max_tokens, llm_choice)
+            chunks.extend(closed)
+            piece_tokens = count_tokens(piece, llm_choice)
+        current.append(piece)
+        current_tokens += piece_tokens
+    if current:
+        chunks.append("".join(current))
+    return chunks
+
+
+def _chunk_sentences(section: str, max_tokens: int, llm_choice: str) -> list:
+    """Splits a section that exceeds the budget at sentence and line boundaries."""
+    return _pack(_SENTENCE_BREAK.split(section), max_tokens, llm_choice, _split_oversized)
+
+
+def chunk_text(text: str, max_tokens: int, llm_choice: str = "openai") -> list:
+    """
+    Splits text into consecutive chunks of at most max_tokens tokens, breaking at numbered
+    section headings where possible, then at sentence and line boundaries.
+    Args:
+        text (str): The text to split.
+        max_tokens (int): The token budget per chunk.
+        llm_choice (str): "openai" uses the exact tokenizer; other providers use the estimate.
+    Returns:
+        list: The chunks, which concatenate back to the original text.
+    """
+    if count_tokens(text, llm_choice) <= max_tokens:
+        return [text]
+    section_chunks = _pack(_SECTION_BREAK.split(text), max_tokens, llm_choice, _chunk_sentences)
+    # Section boundaries are only worth keeping if they do not cost extra chunks (i.e. extra LLM calls)
+    sentence_chunks = _chunk_sentences(text, max_tokens, llm_choice)
+    return section_chunks if len(section_chunks) <= len(sentence_chunks) else sentence_chunks
@@ -3,14 +3,13 @@
 # It orchestrates UI, file handling, and calls to LLM agents.
 
 import streamlit as st
+import hashlib
+import html
 import io
 import os
+import re
 import json
-import pandas as pd # Import pandas for DataFrame display
-import plotly.express as px # For graphs/diagrams
 import time # Import the time module for timing operations
-from docx import Document # Import Document from python-docx for writing DOCX
-from docx.shared import Inches # For potentially adding images, though not used here
 
 # --- IMPORTANT: Load environment variables from .env file ---
 # Ensure python-dotenv is installed (pip install python-dotenv)
@@ -21,253 +20,28 @@ load_dotenv() # This line loads the variables from .env
 # Import helper functions and LLM agents
 import utils
 import agents.llm_connector as llm_connector
+from agents import llm_cache
 # Explicitly import the agent functions
-from agents.data_extraction_agent import data_extraction_agent_run
-from agents.analysis_agent import analysis_agent_run
-from agents.proposal_generation_agent import proposal_generation_agent_run
+from agents.data_extraction_agent import data_extraction_agent_run_async
+from agents.combined_agent import combined_agent_run_async
+from agents.analysis_agent import analysis_agent_stream
+from agents.proposal_generation_agent import proposal_generation_agent_run_async, proposal_generation_agent_stream
 
 
 # --- Streamlit App Configuration (MUST BE THE FIRST STREAMLIT COMMANDS) ---
 st.set_page_config(layout="wide", page_title="SOW-to-Proposal AI Assistant", initial_sidebar_state="expanded")
 
 # --- Custom CSS for professional look and responsiveness ---
-st.markdown("""
-<style>
-    @import url('https://fonts.googleapis.com/css2?family=Inter:wght@300;400;600;700&display=swap');
-
-    html, body, [class*="st-emotion"] {
-        font-family: 'Inter', sans-serif;
-        color: #2c3e50; /* Darker text for professionalism */
-    }
-
-    .stApp {
-        background-color: #f8f9fa; /* Light background */
-        padding: 1rem 5%; /* Responsive padding */
-    }
-
-    /* Adjust main content area padding for better responsiveness */
-    .st-emotion-cache-1cypcdb { /* This specific class might change with Streamlit updates */
-        padding-top: 2rem;
-        padding-bottom: 2rem;
-        padding-left: 0; /* Handled by .stApp padding */
-        padding-right: 0; /* Handled by .stApp padding */
-    }
-
-    h1 {
-        color: #1a2a3a;
-        text-align: center;
-        font-weight: 700;
-        margin-bottom: 0.5em;
-        font-size: 2.5em; /* Larger for impact */
-    }
-
-    h2 {
-        color: #34495e;
-        border-bottom: 2px solid #e9ecef;
-        padding-bottom: 0.5em;
-        margin-top: 2em;
-        font-weight: 600;
-        font-size: 1.8em;
-    }
-
-    h3 {
-        color: #495057;
-        margin-top: 1.5em;
-        font-weight: 600;
-        font-size: 1.4em;
-    }
-
-    /* General button styling */
-    .stButton > button {
-        background-color: #007bff; /* Primary blue for buttons */
-        color: white;
-        border-radius: 8px;
-        border: none;
-        padding: 10px 20px;
-        font-size: 16px;
-        font-weight: 500;
-        transition: all 0.2s ease-in-out;
-        box-shadow: 0 2px 5px rgba(0, 123, 255, 0.2);
-        width: auto; /* Allow buttons to size naturally */
-        display: inline-flex; /* For icon alignment */
-        align-items: center;
-        justify-content: center;
-        gap: 8px;
-    }
-    .stButton > button:hover {
-        background-color: #0056b3;
-        box-shadow: 0 4px 10px rgba(0, 123, 255, 0.3);
-        transform: translateY(-2px);
-    }
-    .stButton > button:active {
-        transform: translateY(0);
-        box-shadow: 0 1px 3px rgba(0, 123, 255, 0.2);
-    }
-
-    /* Metric cards */
-    div[data-testid="stMetric"] {
-        background-color: #ffffff;
-        border-radius: 10px;
-        padding: 15px;
-        box-shadow: 0 2px 8px rgba(0, 0, 0, 0.1);
-        border-left: 5px solid #28a745; /* Green accent */
-        margin-bottom: 15px; /* Spacing between metrics */
-    }
-    div[data-testid="stMetricLabel"] {
-        font-size: 1.1em;
-        font-weight: 600;
-        color: #495057;
-    }
-    div[data-testid="stMetricValue"] {
-        font-size: 2em;
-        font-weight: 700;
-        color: #007bff;
-    }
-
-    /* Tabs styling */
-    .stTabs [data-testid="stTab"] {
-        font-size: 1.1em;
-        font-weight: 600;
-        color: #6c757d;
-        padding: 10px 15px;
-        border-radius: 8px 8px 0 0;
-        transition: all 0.2s ease-in-out;
-    }
-    .stTabs [data-testid="stTab"] p {
-        font-size: 1.1em;
-        margin: 0;
-    }
-    .stTabs [data-testid="stTab"][aria-selected="true"] {
-        color: #007bff;
-        border-bottom: 3px solid #007bff;
-        background-color: #e9f5ff; /* Light blue background for active tab */
-    }
-    .stTabs [data-testid="stTab"]:hover {
-        background-color: #f0f8ff;
-    }
-
-    /* Spinner customization */
-    .stSpinner > div {
-        color: #007bff;
-        font-size: 1.2em;
-        /* Ensure spinner text is horizontal */
-        white-space: nowrap; /* Prevent text from wrapping */
-        display: flex; /* Use flex to align spinner and text */
-        align-items: center; /* Vertically align them */
-        gap: 10px; /* Space between spinner icon and text */
-    }
-    .stSpinner > div > div {
-        border-width: 4px;
-        border-top-color: #007bff;
-        border-left-color: #007bff;
-        width: 30px;
-        height: 30px;
-    }
-
-    /* Alert messages */
-    .stAlert {
-        border-radius: 8px;
-        font-size: 0.95em;
-    }
-    .stAlert.info {
-        background-color: #e7f5ff;
-        color: #004085;
-        border-color: #b8daff;
-    }
-    .stAlert.success {
-        background-color: #d4edda;
-        color: #155724;
-        border-color: #c3e6cb;
-    }
-    .stAlert.error {
-        background-color: #f8d7da;
-        color: #721c24;
-        border-color: #f5c6cb;
-    }
-    .stAlert.warning {
-        background-color: #fff3cd;
-        color: #856404;
-        border-color: #ffeeba;
-    }
-
-    /* Custom styling for lists in dashboard */
-    .dashboard-list ul {
-        list-style-type: none;
-        padding-left: 0;
-    }
-    .dashboard-list li {
-        background-color: #e9ecef;
-        margin-bottom: 5px;
-        padding: 10px 15px;
-        border-radius: 6px;
-        font-size: 0.95em;
-        color: #34495e;
-        box-shadow: 0 1px 3px rgba(0,0,0,0.05);
-    }
-
-    /* Styling for preformatted text (summary, proposal) */
-    pre {
-        background-color: #f1f3f5;
-        padding: 15px;
-        border-radius: 8px;
-        overflow-x: auto;
-        white-space: pre-wrap;
-        word-wrap: break-word;
-        border: 1px solid #dee2e6;
-        font-size: 0.9em;
-        line-height: 1.5;
-        color: #333;
-    }
-
-    /* Dataframe styling */
-    .stDataFrame {
-        border-radius: 8px;
-        overflow: hidden;
-        box-shadow: 0 2px 8px rgba(0, 0, 0, 0.08);
-    }
-    .stDataFrame table {
-        border-collapse: collapse;
-        width: 100%;
-    }
-    .stDataFrame th {
-        background-color: #007bff;
-        color: white;
-        padding: 12px 15px;
-        text-align: left;
-        font-weight: 600;
-    }
-    .stDataFrame td {
-        padding: 10px 15px;
-        border-bottom: 1px solid #dee2e6;
-    }
-    .stDataFrame tr:nth-child(even) {
-        background-color: #f8f9fa;
-    }
-
-    /* Responsive adjustments */
-    @media (max-width: 768px) {
-        .stApp {
-            padding: 1rem 2%;
-        }
-        h1 {
-            font-size: 2em;
-        }
-        h2 {
-            font-size: 1.5em;
-        }
-        .stButton > button {
-            width: 100%; /* Full width buttons on small screens */
-            margin-bottom: 10px;
-        }
-        div[data-testid="stMetric"] {
-            padding: 10px;
-        }
-        div[data-testid="stMetricValue"] {
-            font-size: 1.5em;
-        }
-    }
-</style>
-""", unsafe_allow_html=True)
+# Read and minified once per process; reruns re-send the shorter cached string.
+@st.cache_data(show_spinner=False)
+def load_css(path: str) -> str:
+    with open(path, encoding="utf-8") as css_file:
+        css = css_file.read()
+    css = re.sub(r"/\*.*?\*/", "", css, flags=re.DOTALL) # Drop comments
+    css = re.sub(r"\s+", " ", css) # Collapse whitespace
+    return re.sub(r"\s*([{};,>])\s*", r"\1", css).replace(";}", "}").strip()
+
+st.markdown(f"<style>{load_css(os.path.join(os.path.dirname(__file__), 'assets', 'app.css'))}</style>", unsafe_allow_html=True)
 
 
 st.title("📄 SOW-to-Proposal AI Assistant (MVP)")
@@ -278,13 +52,24 @@ st.markdown("Upload your Scope of Work (SOW) document to get a detailed summary
 # Choose your LLM provider: "openai" or "gemini"
 # Make sure the corresponding API key is set in your .env file
 LLM_CHOICE = "gemini" # <--- IMPORTANT: SET YOUR LLM CHOICE HERE! (e.g., "openai" or "gemini")
+# When True, "Analyze SOW Details" extracts the details, writes the summary and drafts the proposal in a
+# single LLM call (the SOW is read once instead of three times) at the cost of the streamed summary.
+USE_COMBINED_AGENT = False
+# When true, the light-tier Data Extraction Agent starts as soon as a file is uploaded, so "Analyze SOW Details"
+# returns sooner. Off by default: it spends tokens on every upload, even ones that are never analysed.
+SPECULATIVE_EXTRACTION = os.getenv("LLM_SPECULATIVE_EXTRACTION", "false").lower() == "true"
 
 # Display which LLM is being used in the main content area
 st.info(f"💡 Currently using **{LLM_CHOICE.capitalize()}** for AI generation.")
 
-# Initialize LLM clients via the connector
+# Initialize LLM clients via the connector. Streamlit reruns this script on every interaction,
+# so the clients are created once per process and reused across reruns and sessions.
+@st.cache_resource(show_spinner=False)
+def get_llm_clients(llm_choice: str):
+    return llm_connector.initialize_llm_clients(llm_choice)
+
 try:
-    llm_connector.initialize_llm_clients(LLM_CHOICE)
+    llm_connector.openai_client, llm_connector.openai_async_client, llm_connector.gemini_model = get_llm_clients(LLM_CHOICE)
 except ValueError as e:
     st.error(f"LLM Initialization Error: {e}")
     st.stop() # Stop execution if LLM client cannot be initialized
@@ -292,11 +77,270 @@ except ValueError as e:
 
 # Function to clear session state for a fresh start
 def reset_app():
-    for key in st.session_state.keys():
-        del st.session_state[key]
+    st.session_state.clear()
     st.rerun()
 
 st.sidebar.button("🔄 Start Fresh / Reset", on_click=reset_app)
+# Turning the cache off makes this session's calls go to the provider (fresh responses are still stored).
+# The toggle lives in this session's state, so other sessions keep using the cache.
+st.sidebar.toggle("Use LLM response cache", value=True, key="use_llm_cache")
+# Passed as refresh= to every agent call in this session
+refresh_cache = not st.session_state['use_llm_cache']
+# Clears the in-memory and on-disk response caches for every session, unlike "Start Fresh" above,
+# so it is only shown when the operator enables it with LLM_CACHE_ADMIN=true
+if llm_cache.CLEAR_CACHE_BUTTON_ENABLED:
+    st.sidebar.button("🧹 Clear LLM response cache", on_click=llm_cache.clear_caches)
+st.sidebar.caption(f"LLM requests time out after {llm_connector.REQUEST_TIMEOUT:.0f}s and are retried up to {llm_connector.MAX_RETRIES} times.")
+
+
+# Coroutine behind "Analyze SOW Details": the Data Extraction Agent alone, or the combined single-call agent
+def analyze_sow_async(sow_text: str):
+    if USE_COMBINED_AGENT:
+        return combined_agent_run_async(sow_text, llm_choice=LLM_CHOICE, refresh=refresh_cache)
+    return data_extraction_agent_run_async(sow_text, llm_choice=LLM_CHOICE, refresh=refresh_cache)
+
+
+# Reruns re-execute the uploader section, so parsed text is cached per file content.
+# The buffer is excluded from the cache key (leading underscore); the digest identifies the file.
+@st.cache_data(show_spinner=False, ttl=3600)
+def extract_sow_text(file_digest: str, file_extension: str, _file_buffer) -> str:
+    if file_extension == "pdf":
+        # Parsed off the shared LLM loop: short PDFs on a thread, long ones in the worker pool
+        return llm_connector.run_async(utils.extract_text_from_pdf_async(_file_buffer.getvalue()))
+    return utils.extract_text_from_docx(_file_buffer)
+
+
+# Renders a numbered dashboard list as one HTML block (one Streamlit message instead of one per item)
+def render_list(items: list):
+    list_items = "".join(f"<li><b>{i+1}.</b> {html.escape(str(item))}</li>" for i, item in enumerate(items))
+    st.markdown(f'<div class="dashboard-list"><ul>{list_items}</ul></div>', unsafe_allow_html=True)
+
+
+# The dashboard charts are purely informational, so they render as static plots without the
+# mode bar; this skips Plotly's hover/zoom machinery on the client for every chart
+PLOTLY_STATIC_CONFIG = {"staticPlot": True, "displayModeBar": False}
+
+# Dashboard charts only depend on a few counts, so their figures are built once per distinct input.
+# The Figure object itself is cached (cache_resource, no copy per read): st.plotly_chart re-validates
+# a dict on every call but serializes an already-validated Figure directly. Callers must not mutate it.
+@st.cache_resource(show_spinner=False)
+def count_bar_figure(category: str, count: int, title: str, color: str):
+    import plotly.graph_objects as go
+    fig = go.Figure(go.Bar(x=[category], y=[count], marker_color=color, text=[count], textposition='outside'))
+    fig.update_layout(title=title, xaxis_title="", yaxis_title="Count", showlegend=False,
+                      yaxis_range=[0, count + 1] if count < 5 else None, # Auto-scale for larger counts
+                      height=300) # Fixed height for consistency
+    return fig
+
+@st.cache_resource(show_spinner=False)
+def scope_pie_figure(included_count: int, out_of_scope_count: int):
+    import plotly.colors as plotly_colors
+    import plotly.graph_objects as go
+    fig = go.Figure(go.Pie(labels=['Included Scope', 'Out of Scope'], values=[included_count, out_of_scope_count],
+                           marker_colors=plotly_colors.sequential.RdBu[:2]))
+    fig.update_layout(title='Scope Items Distribution', height=350) # Fixed height
+    return fig
+
+
+# The deliverables table is built once per distinct deliverables list rather than on every dashboard rerun
+@st.cache_data(show_spinner=False)
+def deliverables_frame(deliverables: list):
+    import pandas as pd # Only the deliverables table needs pandas, so it is imported on first use
+    # The extraction schema and agent guarantee {"name", "description"} dicts, so no per-item repair is needed here
+    return pd.DataFrame(deliverables, columns=["name", "description"])
+
+
+# One match per line: a "# "/"## " heading marker, a "- " bullet marker, or neither, followed by the line text
+_MARKDOWN_LINE = re.compile(r"^(?:(#{1,2}) |(- ))?(.*)$", re.MULTILINE)
+
+# The DOCX export is rebuilt only when the proposal text changes, not on every rerun of the proposal section
+@st.cache_data(show_spinner=False)
+def proposal_docx_bytes(proposal_markdown: str) -> bytes:
+    from docx import Document # python-docx is only needed once a proposal exists, so it is imported on first use
+    docx_buffer = io.BytesIO()
+    doc = Document()
+    # Simple conversion from Markdown to DOCX (basic headers and paragraphs), classifying every line in one regex scan
+    for heading, bullet, text in (match.groups() for match in _MARKDOWN_LINE.finditer(proposal_markdown)):
+        if heading:
+            doc.add_heading(text, level=len(heading))
+        elif bullet:
+            doc.add_paragraph(text, style='List Bullet')
+        else:
+            doc.add_paragraph(text)
+    doc.save(docx_buffer)
+    return docx_buffer.getvalue()
+
+
+# --- SOW Insights Dashboard ---
+# The dashboard and the proposal section are fragments: a widget inside one (e.g. the
+# Regenerate button) reruns only that fragment instead of the whole script.
+@st.fragment
+def render_dashboard(sow_data: dict):
+    # Every tab body runs on each dashboard rerun, so list sizes are computed once up front
+    counts = {key: len(sow_data.get(key) or []) for key in ("objectives", "scope_of_work", "out_of_scope", "technical_requirements",
+                                                         "key_constraints", "stakeholders", "deliverables")}
+
+    st.markdown("### 📊 Structured SOW Insights Dashboard")
+    st.info("Here's a quick overview of the key information extracted from your SOW, organized for clarity.")
+
+    # --- Dashboard Tabs ---
+    tab1, tab2, tab3, tab4, tab5 = st.tabs(["Overview", "Scope", "Deliverables", "Technical", "Constraints & Stakeholders"])
+
+    with tab1:
+        st.subheader("Project Overview")
+        col_proj_name, col_client_name, col_timeline = st.columns(3)
+        with col_proj_name:
+            st.metric("Project Name", sow_data.get('project_name', 'N/A'))
+        with col_client_name:
+            st.metric("Client Name", sow_data.get('client_name', 'N/A'))
+        with col_timeline:
+            # Display timeline as a joined string for metric, or list in detail section
+            timeline_display = " | ".join(sow_data.get('timeline_overview', ['N/A'])) if sow_data.get('timeline_overview') else 'N/A'
+            st.metric("Timeline Overview", timeline_display)
+
+        st.markdown("---")
+        st.markdown("#### Key Objectives")
+        if counts["objectives"]:
+            render_list(sow_data["objectives"])
+        else:
+            st.info("No specific objectives identified in the SOW.")
+
+        # Conditional Chart: Bar chart for count of objectives
+        if counts["objectives"]:
+            fig = count_bar_figure('Key Objectives', counts["objectives"], 'Number of Key Objectives Identified', '#28a745') # Green color
+            st.plotly_chart(fig, use_container_width=True, config=PLOTLY_STATIC_CONFIG)
+        else:
+            st.markdown("*(Chart not available: No objectives data to plot.)*")
+
+
+    with tab2:
+        st.subheader("Scope Definition")
+        col_scope_in, col_scope_out = st.columns(2)
+        with col_scope_in:
+            st.markdown("**Included Scope of Work:**")
+            if counts["scope_of_work"]:
+                render_list(sow_data["scope_of_work"])
+            else:
+                st.info("No detailed included scope identified.")
+        with col_scope_out:
+            st.markdown("**Out of Scope:**")
+            if counts["out_of_scope"]:
+                render_list(sow_data["out_of_scope"])
+            else:
+                st.info("No specific out-of-scope items identified.")
+
+        # Conditional Chart: Pie chart for scope distribution
+        if counts["scope_of_work"] or counts["out_of_scope"]: # Only show chart if there's any scope data
+            fig_pie = scope_pie_figure(counts["scope_of_work"], counts["out_of_scope"])
+            st.plotly_chart(fig_pie, use_container_width=True, config=PLOTLY_STATIC_CONFIG)
+        else:
+            st.markdown("*(Chart not available: No scope data to plot.)*")
+
+
+    with tab3:
+        st.subheader("Key Deliverables")
+        if counts["deliverables"]:
+            deliverables_df = deliverables_frame(sow_data["deliverables"])
+
+            if not deliverables_df.empty:
+                st.dataframe(deliverables_df, use_container_width=True, hide_index=True)
+            else:
+                st.info("No specific deliverables identified or could not be parsed into a table.")
+        else:
+            st.info("No specific deliverables identified.")
+
+    with tab4:
+        st.subheader("Technical Landscape")
+        st.markdown("**Technical Requirements:**")
+        if counts["technical_requirements"]:
+            render_list(sow_data["technical_requirements"])
+        else:
+            st.info("No specific technical requirements identified.")
+
+        # Conditional Chart: Bar chart for number of technical requirements
+        if counts["technical_requirements"]:
+            fig = count_bar_figure('Technical Requirements', counts["technical_requirements"],
+                                   'Number of Technical Requirements Identified', '#17a2b8') # Info color
+            st.plotly_chart(fig, use_container_width=True, config=PLOTLY_STATIC_CONFIG)
+        else:
+            st.markdown("*(Chart not available: No technical requirements data to plot.)*")
+
+    with tab5:
+        st.subheader("Constraints & Key Stakeholders")
+        col_constr, col_stake_detail = st.columns(2)
+        with col_constr:
+            st.markdown("**Key Constraints:**")
+            if counts["key_constraints"]:
+                render_list(sow_data["key_constraints"])
+            else:
+                st.info("No specific constraints identified.")
+        with col_stake_detail:
+            st.markdown("**Key Stakeholders:**")
+            if counts["stakeholders"]:
+                render_list(sow_data["stakeholders"])
+            else:
+                st.info("No specific stakeholders identified.")
+
+
+# --- Draft Technical Proposal Section ---
+@st.fragment
+# The agents report failures as "Error: ..." chunks rather than raising, so streamed output is
+# checked for them before it is kept as a result
+def watch_stream_errors(chunks, errors: list):
+    for chunk in chunks:
+        if chunk.startswith("Error:"):
+            errors.append(chunk)
+        yield chunk
+
+
+def render_proposal(sow_data: dict):
+    st.header("3. Generate Technical Proposal Draft 🚀")
+    st.info("A preliminary technical proposal is drafted alongside the SOW summary. Remember, this is a draft and requires human review and refinement.")
+    regenerate_proposal = st.button("Regenerate Proposal Draft", key="generate_proposal_btn")
+    # Check if the selected LLM client is initialized
+    if regenerate_proposal and not llm_connector.is_ready(LLM_CHOICE):
+        st.error(f"{LLM_CHOICE.capitalize()} LLM client not properly initialized. Please check your API key setup in .env.")
+        regenerate_proposal = False
+
+    if regenerate_proposal or st.session_state.get('proposal_draft'):
+        st.markdown("### ✍️ Your Generated Proposal Draft")
+        if regenerate_proposal:
+            start_time_proposal = time.time() # Start timer for proposal
+            # Streamed in place; refresh=True skips the response cache so a new variant is drafted
+            stream_errors = []
+            proposal_draft = st.write_stream(watch_stream_errors(
+                proposal_generation_agent_stream(sow_data, llm_choice=LLM_CHOICE, refresh=True), stream_errors
+            ))
+            if stream_errors: # A partial draft is neither kept nor offered for download
+                st.error(f"Proposal Generation Agent failed: {stream_errors[0]}")
+                return
+            st.session_state['proposal_draft'] = proposal_draft
+            st.success("Technical proposal draft generated!")
+            end_time_proposal = time.time() # End timer for proposal
+            st.info(f"**Proposal Generation Agent** took {end_time_proposal - start_time_proposal:.2f} seconds.")
+        else:
+            st.markdown(st.session_state['proposal_draft'])
+
+        # Buttons for download and copy
+        col_dl_md, col_dl_docx, col_copy = st.columns(3) # Added a column for DOCX download
+        with col_dl_md:
+            st.download_button(
+                label="Download as Markdown",
+                data=st.session_state['proposal_draft'].encode('utf-8'), # Bytes are served as-is, without re-encoding
+                file_name="technical_proposal_draft.md",
+                mime="text/markdown"
+            )
+        with col_dl_docx:
+            st.download_button(
+                label="Download as DOCX",
+                data=proposal_docx_bytes(st.session_state['proposal_draft']),
+                file_name="technical_proposal_draft.docx",
+                mime="application/vnd.openxmlformats-officedocument.wordprocessingml.document"
+            )
+        with col_copy:
+            st.markdown("**Copy Proposal Draft:**")
+            # st.code is a static element with a built-in copy button, unlike a text_area widget
+            st.code(st.session_state['proposal_draft'], language="markdown")
 
 
 # --- File Uploader Section ---
@@ -306,14 +350,19 @@ uploaded_file = st.file_uploader("Select a PDF or DOCX file", type=["pdf", "docx
 sow_text = ""
 if uploaded_file is not None:
     file_extension = uploaded_file.name.split(".")[-1].lower()
-    file_buffer = io.BytesIO(uploaded_file.getvalue())
+    # UploadedFile is already a BytesIO, so it is parsed in place rather than copied
+    file_buffer = uploaded_file
+    file_buffer.seek(0) # Earlier reruns may have left the read position at the end
+    # Hash each upload once; later reruns with the same file reuse the digest
+    if st.session_state.get('sow_file_id') != uploaded_file.file_id:
+        st.session_state['sow_file_id'] = uploaded_file.file_id
+        st.session_state['sow_file_digest'] = hashlib.sha256(file_buffer.getbuffer()).hexdigest()
+    file_digest = st.session_state['sow_file_digest']
 
     start_time_extraction = time.time() # Start timer for extraction
     with st.spinner("🚀 Extracting text from SOW... This may take a moment for larger files."):
-        if file_extension == "pdf":
-            sow_text = utils.extract_text_from_pdf(file_buffer)
-        elif file_extension == "docx":
-            sow_text = utils.extract_text_from_docx(file_buffer)
+        if file_extension in ("pdf", "docx"):
+            sow_text = extract_sow_text(file_digest, file_extension, file_buffer)
         else:
             st.error("Unsupported file type. Please upload a PDF or DOCX.")
             sow_text = ""
@@ -321,6 +370,13 @@ if uploaded_file is not None:
 
     if sow_text:
         st.success(f"Text extracted successfully! 🎉 (Took {end_time_extraction - start_time_extraction:.2f} seconds)")
+        # Optionally start the Data Extraction Agent speculatively, once per file, while the user reviews the raw text;
+        # the Analyze button then only waits for whatever of the call is still outstanding. The combined agent's much
+        # larger call is never speculated.
+        if SPECULATIVE_EXTRACTION and not USE_COMBINED_AGENT and \
+           st.session_state.get('sow_extraction_digest') != file_digest and llm_connector.is_ready(LLM_CHOICE):
+            st.session_state['sow_extraction_digest'] = file_digest
+            st.session_state['sow_extraction_future'] = llm_connector.submit_async(analyze_sow_async(sow_text))
         with st.expander("View Raw Extracted Text (Click to expand)"):
             st.text_area("Raw SOW Text", sow_text, height=300, disabled=True)
     else:
@@ -336,16 +392,29 @@ if sow_text:
             st.warning("Please upload an SOW document first.")
         else:
             # Check if the selected LLM client is initialized
-            if (LLM_CHOICE == "openai" and not llm_connector.openai_client) or \
-               (LLM_CHOICE == "gemini" and not llm_connector.gemini_model):
+            if not llm_connector.is_ready(LLM_CHOICE):
                 st.error(f"{LLM_CHOICE.capitalize()} LLM client not properly initialized. Please check your API key setup in .env.")
             else:
                 start_time_data_extraction_agent = time.time() # Start timer for Data Extraction Agent
                 with st.spinner(" **Data Extraction Agent** is analyzing SOW details..."):
-                    # Corrected function call: directly call the imported function
-                    sow_structured_data = data_extraction_agent_run(sow_text, llm_choice=LLM_CHOICE)
+                    # Runs on the shared LLM event loop so it reuses the async clients' open connections.
+                    # A speculative run started at upload is consumed once. Later clicks send the same request again,
+                    # so they are answered from the response cache unless "Use cache" is off; responses that were
+                    # cut off or are not valid JSON are never cached, so a failed extraction is retried.
+                    extraction_future = st.session_state.pop('sow_extraction_future', None)
+                    if extraction_future is not None:
+                        analysis_result = extraction_future.result()
+                    else:
+                        analysis_result = llm_connector.run_async(analyze_sow_async(sow_text))
+                    sow_structured_data = analysis_result.get("structured", analysis_result)
                     if sow_structured_data and not sow_structured_data.get("error"):
                         st.session_state['sow_structured_data'] = sow_structured_data
+                        # A new analysis invalidates the summary and draft generated from the previous one
+                        st.session_state.pop('detailed_summary', None)
+                        st.session_state.pop('proposal_draft', None)
+                        if "summary" in analysis_result: # Combined agent: both were generated in the same call
+                            st.session_state['detailed_summary'] = analysis_result["summary"]
+                            st.session_state['proposal_draft'] = analysis_result["proposal"]
                         st.success("Data Extraction Agent complete! ✨")
                     else:
                         st.error(f"Data Extraction Agent failed: {sow_structured_data.get('error', 'Unknown error.')}")
@@ -359,222 +428,36 @@ if sow_text:
     if 'sow_structured_data' in st.session_state and st.session_state['sow_structured_data'] and \
        not st.session_state['sow_structured_data'].get("error"):
         sow_data = st.session_state['sow_structured_data']
-
-        st.markdown("### 📊 Structured SOW Insights Dashboard")
-        st.info("Here's a quick overview of the key information extracted from your SOW, organized for clarity.")
-
-        # --- Dashboard Tabs ---
-        tab1, tab2, tab3, tab4, tab5 = st.tabs(["Overview", "Scope", "Deliverables", "Technical", "Constraints & Stakeholders"])
-
-        with tab1:
-            st.subheader("Project Overview")
-            col_proj_name, col_client_name, col_timeline = st.columns(3)
-            with col_proj_name:
-                st.metric("Project Name", sow_data.get('project_name', 'N/A'))
-            with col_client_name:
-                st.metric("Client Name", sow_data.get('client_name', 'N/A'))
-            with col_timeline:
-                # Display timeline as a joined string for metric, or list in detail section
-                timeline_display = " | ".join(sow_data.get('timeline_overview', ['N/A'])) if sow_data.get('timeline_overview') else 'N/A'
-                st.metric("Timeline Overview", timeline_display)
-
-            st.markdown("---")
-            st.markdown("#### Key Objectives")
-            if sow_data.get("objectives"):
-                st.markdown('<div class="dashboard-list"><ul>', unsafe_allow_html=True)
-                for i, obj in enumerate(sow_data["objectives"]):
-                    st.markdown(f"<li>**{i+1}.** {obj}</li>", unsafe_allow_html=True)
-                st.markdown('</ul></div>', unsafe_allow_html=True)
-            else:
-                st.info("No specific objectives identified in the SOW.")
-            
-            # Conditional Chart: Bar chart for count of objectives
-            if sow_data.get("objectives") and len(sow_data["objectives"]) > 0:
-                obj_count = len(sow_data["objectives"])
-                obj_count_df = pd.DataFrame({'Category': ['Key Objectives'], 'Count': [obj_count]})
-                
-                # Make chart more flexible: only show if count > 0, and auto-scale y-axis
-                fig = px.bar(obj_count_df, x='Category', y='Count', title='Number of Key Objectives Identified', text_auto=True,
-                             color_discrete_sequence=['#28a745']) # Green color
-                fig.update_traces(texttemplate='%{text}', textposition='outside')
-                fig.update_layout(xaxis_title="", yaxis_title="Count", showlegend=False,
-                                  yaxis_range=[0, obj_count + 1] if obj_count < 5 else None, # Auto-scale for larger counts
-                                  height=300) # Fixed height for consistency
-                st.plotly_chart(fig, use_container_width=True)
-            else:
-                st.markdown("*(Chart not available: No objectives data to plot.)*")
-
-
-        with tab2:
-            st.subheader("Scope Definition")
-            col_scope_in, col_scope_out = st.columns(2)
-            with col_scope_in:
-                st.markdown("**Included Scope of Work:**")
-                if sow_data.get("scope_of_work"):
-                    st.markdown('<div class="dashboard-list"><ul>', unsafe_allow_html=True)
-                    for i, item in enumerate(sow_data["scope_of_work"]):
-                        st.markdown(f"<li>**{i+1}.** {item}</li>", unsafe_allow_html=True)
-                    st.markdown('</ul></div>', unsafe_allow_html=True)
-                else:
-                    st.info("No detailed included scope identified.")
-            with col_scope_out:
-                st.markdown("**Out of Scope:**")
-                if sow_data.get("out_of_scope"):
-                    st.markdown('<div class="dashboard-list"><ul>', unsafe_allow_html=True)
-                    for i, item in enumerate(sow_data["out_of_scope"]):
-                        st.markdown(f"<li>**{i+1}.** {item}</li>", unsafe_allow_html=True)
-                    st.markdown('</ul></div>', unsafe_allow_html=True)
-                else:
-                    st.info("No specific out-of-scope items identified.")
-
-            # Conditional Chart: Pie chart for scope distribution
-            scope_counts = {'Included Scope': len(sow_data.get("scope_of_work", [])),
-                            'Out of Scope': len(sow_data.get("out_of_scope", []))}
-            
-            if sum(scope_counts.values()) > 0: # Only show chart if there's any scope data
-                scope_df = pd.DataFrame(list(scope_counts.items()), columns=['Category', 'Count'])
-                fig_pie = px.pie(scope_df, values='Count', names='Category', title='Scope Items Distribution',
-                                 color_discrete_sequence=px.colors.sequential.RdBu,
-                                 height=350) # Fixed height
-                st.plotly_chart(fig_pie, use_container_width=True)
-            else:
-                st.markdown("*(Chart not available: No scope data to plot.)*")
-
-
-        with tab3:
-            st.subheader("Key Deliverables")
-            if sow_data.get("deliverables"):
-                # Ensure deliverables are in a suitable format for DataFrame
-                cleaned_deliverables = []
-                for item in sow_data["deliverables"]:
-                    if isinstance(item, dict) and "name" in item and "description" in item:
-                        cleaned_deliverables.append(item)
-                    elif isinstance(item, str): # Handle if LLM returned list of strings
-                         cleaned_deliverables.append({"name": item, "description": "Not detailed by AI"})
-                
-                if cleaned_deliverables:
-                    deliverables_df = pd.DataFrame(cleaned_deliverables)
-                    st.dataframe(deliverables_df, use_container_width=True, hide_index=True)
-                else:
-                    st.info("No specific deliverables identified or could not be parsed into a table.")
-            else:
-                st.info("No specific deliverables identified.")
-
-        with tab4:
-            st.subheader("Technical Landscape")
-            st.markdown("**Technical Requirements:**")
-            if sow_data.get("technical_requirements"):
-                st.markdown('<div class="dashboard-list"><ul>', unsafe_allow_html=True)
-                for i, tech in enumerate(sow_data["technical_requirements"]):
-                    st.markdown(f"<li>**{i+1}.** {tech}</li>", unsafe_allow_html=True)
-                st.markdown('</ul></div>', unsafe_allow_html=True)
-            else:
-                st.info("No specific technical requirements identified.")
-            
-            # Conditional Chart: Bar chart for number of technical requirements
-            if sow_data.get("technical_requirements") and len(sow_data["technical_requirements"]) > 0:
-                tech_count = len(sow_data["technical_requirements"])
-                tech_count_df = pd.DataFrame({'Category': ['Technical Requirements'], 'Count': [tech_count]})
-                fig = px.bar(tech_count_df, x='Category', y='Count', title='Number of Technical Requirements Identified', text_auto=True,
-                             color_discrete_sequence=['#17a2b8']) # Info color
-                fig.update_traces(texttemplate='%{text}', textposition='outside')
-                fig.update_layout(xaxis_title="", yaxis_title="Count", showlegend=False,
-                                  yaxis_range=[0, tech_count + 1] if tech_count < 5 else None, # Auto-scale for smaller counts
-                                  height=300) # Fixed height
-                st.plotly_chart(fig, use_container_width=True)
-            else:
-                st.markdown("*(Chart not available: No technical requirements data to plot.)*")
-
-        with tab5:
-            st.subheader("Constraints & Key Stakeholders")
-            col_constr, col_stake_detail = st.columns(2)
-            with col_constr:
-                st.markdown("**Key Constraints:**")
-                if sow_data.get("key_constraints"):
-                    st.markdown('<div class="dashboard-list"><ul>', unsafe_allow_html=True)
-                    for i, constr in enumerate(sow_data["key_constraints"]):
-                        st.markdown(f"<li>**{i+1}.** {constr}</li>", unsafe_allow_html=True)
-                    st.markdown('</ul></div>', unsafe_allow_html=True)
-                else:
-                    st.info("No specific constraints identified.")
-            with col_stake_detail:
-                st.markdown("**Key Stakeholders:**")
-                if sow_data.get("stakeholders"):
-                    st.markdown('<div class="dashboard-list"><ul>', unsafe_allow_html=True)
-                    for i, stakeholder in enumerate(sow_data["stakeholders"]):
-                        st.markdown(f"<li>**{i+1}.** {stakeholder}</li>", unsafe_allow_html=True)
-                    st.markdown('</ul></div>', unsafe_allow_html=True)
-                else:
-                    st.info("No specific stakeholders identified.")
+        render_dashboard(sow_data)
 
         st.markdown("---")
         st.markdown("### 📝 Detailed Narrative Summary of SOW")
-        start_time_summary = time.time() # Start timer for summary
-        with st.spinner("✍️ **Analysis Agent** is generating detailed narrative summary..."):
-            # Corrected function call: directly call the imported function
-            detailed_summary = analysis_agent_run(sow_data, llm_choice=LLM_CHOICE)
-            st.write(detailed_summary)
-        end_time_summary = time.time() # End timer for summary
-        st.info(f"**Analysis Agent** (Summary Generation) took {end_time_summary - start_time_summary:.2f} seconds.")
+        if 'detailed_summary' not in st.session_state:
+            start_time_summary = time.time() # Start timer for summary + proposal
+            # The proposal depends only on the structured SOW data, so it is drafted in the
+            # background while the summary streams onto the page.
+            proposal_future = llm_connector.submit_async(proposal_generation_agent_run_async(sow_data, llm_choice=LLM_CHOICE, refresh=refresh_cache))
+            st.session_state['detailed_summary'] = st.write_stream(analysis_agent_stream(sow_data, llm_choice=LLM_CHOICE, refresh=refresh_cache))
+            with st.spinner("🤖 **Proposal Generation Agent** is finishing the proposal draft..."):
+                proposal_draft = proposal_future.result()
+            if proposal_draft.startswith("Error:"): # Left unset, so the Regenerate button can retry
+                st.error(f"Proposal Generation Agent failed: {proposal_draft}")
+            else:
+                st.session_state['proposal_draft'] = proposal_draft
+            end_time_summary = time.time() # End timer for summary + proposal
+            st.info(f"**Analysis Agent** and **Proposal Generation Agent** (run concurrently) took {end_time_summary - start_time_summary:.2f} seconds.")
+        else:
+            st.write(st.session_state['detailed_summary'])
         st.markdown("---")
 
-        # --- Draft Technical Proposal Section ---
-        st.header("3. Generate Technical Proposal Draft 🚀")
-        st.info("This will generate a preliminary technical proposal based on the SOW analysis. Remember, this is a draft and requires human review and refinement.")
-        if st.button("Generate Proposal Draft", key="generate_proposal_btn"):
-            # Check if the selected LLM client is initialized
-            if (LLM_CHOICE == "openai" and not llm_connector.openai_client) or \
-               (LLM_CHOICE == "gemini" and not llm_connector.gemini_model):
-                st.error(f"{LLM_CHOICE.capitalize()} LLM client not properly initialized. Please check your API key setup in .env.")
-            else:
-                start_time_proposal = time.time() # Start timer for proposal
-                with st.spinner("🤖 **Proposal Generation Agent** is drafting technical proposal... This will take a moment."):
-                    # Corrected function call: directly call the imported function
-                    proposal_draft = proposal_generation_agent_run(sow_data, llm_choice=LLM_CHOICE)
-                    st.session_state['proposal_draft'] = proposal_draft
-                    st.success("Technical proposal draft generated!")
-                end_time_proposal = time.time() # End timer for proposal
-                st.info(f"**Proposal Generation Agent** took {end_time_proposal - start_time_proposal:.2f} seconds.")
-
-        if 'proposal_draft' in st.session_state and st.session_state['proposal_draft']:
-            st.markdown("### ✍️ Your Generated Proposal Draft")
-            st.markdown(st.session_state['proposal_draft'])
+        render_proposal(sow_data)
 
-            # Buttons for download and copy
-            col_dl_md, col_dl_docx, col_copy = st.columns(3) # Added a column for DOCX download
-            with col_dl_md:
-                st.download_button(
-                    label="Download as Markdown",
-                    data=st.session_state['proposal_draft'],
-                    file_name="technical_proposal_draft.md",
-                    mime="text/markdown"
-                )
-            with col_dl_docx:
-                # Generate DOCX content
-                docx_buffer = io.BytesIO()
-                doc = Document()
-                # Simple conversion from Markdown to DOCX (basic headers and paragraphs)
-                for line in st.session_state['proposal_draft'].split('\n'):
-                    if line.startswith('## '):
-                        doc.add_heading(line.replace('## ', ''), level=2)
-                    elif line.startswith('# '):
-                        doc.add_heading(line.replace('# ', ''), level=1)
-                    elif line.startswith('- '):
-                        doc.add_paragraph(line.replace('- ', ''), style='List Bullet')
-                    else:
-                        doc.add_paragraph(line)
-                doc.save(docx_buffer)
-                docx_buffer.seek(0) # Rewind the buffer to the beginning
-
-                st.download_button(
-                    label="Download as DOCX",
-                    data=docx_buffer.getvalue(),
-                    file_name="technical_proposal_draft.docx",
-                    mime="application/vnd.openxmlformats-officedocument.wordprocessingml.document"
-                )
-            with col_copy:
-                st.text_area("Copy Proposal Draft (Manual Copy)", st.session_state['proposal_draft'], height=200, help="Select all text and copy manually.")
-                st.info("For security reasons, direct 'Copy to Clipboard' is not available in Streamlit. Please manually select and copy the text from the box above.")
+# Rendered last so the counts include this run's LLM calls
+col_cache_hits, col_cache_misses = st.sidebar.columns(2)
+col_cache_hits.metric("Cache hits", llm_cache.exact_cache.hits)
+col_cache_misses.metric("Cache misses", llm_cache.exact_cache.misses)
+if llm_cache.SEMANTIC_CACHE_ENABLED: # Exact misses that a near-duplicate prompt then answered
+    st.sidebar.caption(f"Semantic cache: {llm_cache.semantic_cache.hits} hits, {llm_cache.semantic_cache.misses} misses")
 
 # --- Footer ---
 st.markdown("---")
@@ -0,0 +1,31 @@
+# --- tests/test_data_extraction_agent.py ---
+# Parsing tests for agents/data_extraction_agent.py: every parser path must clean deliverables the same way.
+
+import json
+
+from agents import data_extraction_agent
+
+_DELIVERABLES = [
+    {"name": "Design Document", "description": "Architecture overview"},
+    {"name": "  ", "description": "Blank name"},
+    {"name": " N/A ", "description": "Placeholder name"},
+]
+_EXPECTED = [{"name": "Design Document", "description": "Architecture overview"}]
+
+
+def test_strict_parser_drops_blank_deliverable_names():
+    response = json.dumps({"project_name": "Portal", "deliverables": _DELIVERABLES})
+    assert data_extraction_agent._parse_strict(response)["deliverables"] == _EXPECTED
+
+
+def test_lenient_parser_drops_blank_deliverable_names():
+    # A non-list "objectives" fails the schema, so the lenient path (and msgspec deliverables branch) runs
+    response = json.dumps({"project_name": "Portal", "objectives": "Launch", "deliverables": _DELIVERABLES})
+    assert data_extraction_agent._parse_strict(response) is None
+    assert data_extraction_agent._parse_lenient(response)["deliverables"] == _EXPECTED
+
+
+def test_item_by_item_cleanup_drops_blank_deliverable_names(monkeypatch):
+    monkeypatch.setattr(data_extraction_agent, "msgspec", None)
+    raw = [*_DELIVERABLES, "   ", {"name": None}]
+    assert data_extraction_agent._clean_deliverables(raw) == _EXPECTED
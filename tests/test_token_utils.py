@@ -0,0 +1,36 @@
+# --- tests/test_token_utils.py ---
+# Chunking tests for agents/token_utils.py and the SOW splitting built on it.
+
+from agents import token_utils
+from agents.data_extraction_agent import MAX_SOW_CHUNKS, SOW_TOKEN_BUDGET, _split_sow
+
+
+def _section(number: int, sentences: int) -> str:
+    """Builds a numbered SOW section made of identical sentences."""
+    return f"{number}. Section Heading\n" + "The vendor shall deliver the agreed work on schedule. " * sentences + "\n"
+
+
+def test_long_multi_section_sow_fits_max_chunks():
+    # Sections that are each just over one chunk used to leave a short, unjoinable tail chunk apiece
+    sow_text = "Statement of Work\n" + "".join(_section(n, 500) for n in range(1, 9)) + "Signed: Client\n"
+    truncated = token_utils.truncate_to_tokens(sow_text, SOW_TOKEN_BUDGET * MAX_SOW_CHUNKS, llm_choice="gemini")
+
+    packed = token_utils.chunk_text(truncated, SOW_TOKEN_BUDGET, llm_choice="gemini")
+    assert len(packed) <= MAX_SOW_CHUNKS + 1 # Sentence boundaries rarely land exactly on the budget
+
+    chunks = _split_sow(sow_text, "gemini")
+    assert len(chunks) == MAX_SOW_CHUNKS
+    assert "".join(chunks) == truncated
+
+
+def test_chunk_text_joins_short_title_and_trailing_text():
+    text = "Statement of Work\n" + _section(1, 30) + "Signed: Client\n"
+    chunks = token_utils.chunk_text(text, 300, llm_choice="gemini")
+    assert len(chunks) == 2
+    assert chunks[0].startswith("Statement of Work\n1. Section Heading")
+    assert chunks[-1].endswith("Signed: Client\n")
+    assert "".join(chunks) == text
+
+
+def test_chunk_text_keeps_short_text_whole():
+    assert token_utils.chunk_text("1. Scope\nShort.", 100, llm_choice="gemini") == ["1. Scope\nShort."]